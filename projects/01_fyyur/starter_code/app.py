@@ -3,18 +3,37 @@
 # ---------------------------------------------------------------------------- #
 
 
+import bisect
+import ipaddress
 import json
+import socket
+import time
 import datetime as dt
+from itertools import groupby
 import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+import click
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 import logging
+import urllib.error
+import urllib.parse
+import urllib.request
 from logging import Formatter, FileHandler
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from flask_wtf import Form
-from forms import VenueForm, ArtistForm, ShowForm
+from forms import VenueForm, ArtistForm, ShowForm, LazyChoices, GENRE_CHOICES, MAX_SHOW_MINUTES
+from search import register_fts_index, register_prefix_index, search_by_name, prefix_search, TYPEAHEAD_LIMIT
+from page_cache import PageCache
+from formatting import format_datetime
+from instrumentation import QueryInstrumentation
+from db_pool import PoolMonitor
+from streaming import YIELD_PER, json_response, stream_json
+from tasks import TaskQueue
+from geo import register_geohash, geohash_encode, nearby
+from assets import Assets, build as build_assets
+from importer import CHUNK_SIZE, read_rows, chunked, validate_row, insert_batch, reset_id_sequence
 
 
 # ---------------------------------------------------------------------------- #
@@ -26,7 +45,13 @@ app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
 db = SQLAlchemy(app)
+pool_monitor = PoolMonitor(app, db)
+tasks = TaskQueue(app, db)
 migrate = Migrate(app, db)
+page_cache = PageCache(app)
+page_cache.watch(db.session)
+instrumentation = QueryInstrumentation(app)
+assets = Assets(app)
 
 
 # ---------------------------------------------------------------------------- #
@@ -36,6 +61,11 @@ migrate = Migrate(app, db)
 
 class Venue(db.Model):
     __tablename__ = 'venues'
+    __table_args__ = (
+        db.Index('ix_venues_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_venues_state_city', 'state', 'city'),
+        db.Index('ix_venues_geohash', 'geohash'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     city = db.Column(db.String(120))
@@ -44,25 +74,54 @@ class Venue(db.Model):
     phone = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    # maintained by geo.register_geohash
+    geohash = db.Column(db.String(12))
+    upcoming_show_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_show_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     shows = db.relationship('Show', backref='venue_show', lazy=True)
 
     def __repr__(self):
         return f'<Venue #{self.id}: {self.name}>'
 
 
+artist_genres = db.Table(
+    'artist_genres',
+    db.Column('genre_id', db.Integer, db.ForeignKey('genres.id'), primary_key=True),
+    db.Column('artist_id', db.Integer, db.ForeignKey('artists.id'), primary_key=True),
+    db.Index('ix_artist_genres_artist_id', 'artist_id')
+)
+
+
+class Genre(db.Model):
+    __tablename__ = 'genres'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+
+    def __repr__(self):
+        return f'<Genre #{self.id}: {self.name}>'
+
+
 class Artist(db.Model):
     __tablename__ = 'artists'
+    __table_args__ = (
+        db.Index('ix_artists_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_artists_name', 'name'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
     website = db.Column(db.String(500))
-    genres = db.Column(db.String(120))
+    genres = db.relationship('Genre', secondary=artist_genres, lazy=True, order_by='Genre.name')
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean(), default=False)
     seeking_description = db.Column(db.String(255))
+    upcoming_show_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_show_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     shows = db.relationship('Show', backref='artist_show', lazy=True)
 
     def __repr__(self):
@@ -71,30 +130,788 @@ class Artist(db.Model):
 
 class Show(db.Model):
     __tablename__ = 'shows'
+    __table_args__ = (
+        db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_shows_start_time_id', 'start_time', 'id'),
+        db.CheckConstraint(f'duration BETWEEN 1 AND {MAX_SHOW_MINUTES}', name='ck_shows_duration'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     venue_id = db.Column(db.Integer, db.ForeignKey('venues.id'), nullable=False)
     artist_id = db.Column(db.Integer, db.ForeignKey('artists.id'), nullable=False)
     start_time = db.Column(db.DateTime, nullable=False)
+    # minutes, at most MAX_SHOW_MINUTES; no two shows of a venue or an artist
+    # may overlap, see booking_conflicts and the exclusion constraints of
+    # migration f3c9d1e5a7b2
+    duration = db.Column(db.Integer, nullable=False, default=180, server_default='180')
+
+    @property
+    def end_time(self):
+        return self.start_time + dt.timedelta(minutes=self.duration)
 
     def __repr__(self):
         return f'<Show #{self.id}: artist {self.artist_id} at venue {self.venue_id} on {self.start_time}>'
 
 
+class ShowCounterState(db.Model):
+    # single row: venue/artist show counters count shows up to and including
+    # rolled_until as past, everything after it as upcoming
+    __tablename__ = 'show_counter_state'
+    id = db.Column(db.Integer, primary_key=True)
+    rolled_until = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<ShowCounterState: rolled until {self.rolled_until}>'
+
+
+register_fts_index(Venue.__table__)
+register_fts_index(Artist.__table__)
+register_prefix_index(Venue.__table__)
+register_prefix_index(Artist.__table__)
+register_geohash(Venue)
+
+
 # ---------------------------------------------------------------------------- #
 # Filters.
 # ---------------------------------------------------------------------------- #
 
 
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format)
+app.jinja_env.filters['datetime'] = format_datetime
 
 
-app.jinja_env.filters['datetime'] = format_datetime
+# ---------------------------------------------------------------------------- #
+# Queries.
+# ---------------------------------------------------------------------------- #
+
+
+def invalidate_pages(*tags):
+    # cached pages depending on `tags` are invalidated once the current
+    # transaction commits
+    page_cache.invalidate_on_commit(db.session, *tags)
+
+
+def venues_with_upcoming_counts():
+    # counts come from the materialized per-venue counters, see Show counters
+    return db.session.query(
+        Venue.id,
+        Venue.name,
+        Venue.city,
+        Venue.state,
+        Venue.upcoming_show_count.label('num_upcoming_shows')
+    ).order_by(Venue.state, Venue.city, Venue.id)
+
+
+def group_venues_by_area(rows):
+    # group by (city, state) in a single pass, keeping first-seen area order
+    areas = {}
+    for row in rows:
+        area = areas.get((row.city, row.state))
+        if area is None:
+            area = areas[(row.city, row.state)] = {
+                'city': row.city,
+                'state': row.state,
+                'venues': []
+            }
+        area['venues'].append({
+            'id': row.id,
+            'name': row.name,
+            'num_upcoming_shows': row.num_upcoming_shows
+        })
+    return list(areas.values())
+
+
+def iter_venue_areas(rows):
+    # like group_venues_by_area, but yields each area as soon as it is
+    # complete; relies on rows being ordered by (state, city)
+    for (state, city), group in groupby(rows, key=lambda row: (row.state, row.city)):
+        yield {
+            'city': city,
+            'state': state,
+            'venues': [{
+                'id': row.id,
+                'name': row.name,
+                'num_upcoming_shows': row.num_upcoming_shows
+            } for row in group]
+        }
+
+
+def genres_by_name(names):
+    # Genre rows for `names`, creating any that don't exist yet
+    names = sorted({name.strip() for name in names if name.strip()})
+    existing = {genre.name: genre for genre in Genre.query.filter(Genre.name.in_(names))} if names else {}
+    created = False
+    for name in names:
+        if name not in existing:
+            existing[name] = Genre(name=name)
+            db.session.add(existing[name])
+            created = True
+    if created:
+        invalidate_pages('genres')
+    return [existing[name] for name in names]
+
+
+def load_genre_choices():
+    names = {name for name, in db.session.query(Genre.name)} | {value for value, _ in GENRE_CHOICES}
+    return [(name, name) for name in sorted(names)]
+
+
+# form genre choices are re-read only after a new genre is created
+LazyChoices.loaders['genres'] = page_cache.versioned('genres', load_genre_choices)
+
+
+def artists_by_genre(genre=None):
+    # served by the (genre_id, artist_id) primary key of artist_genres
+    query = db.session.query(Artist.id, Artist.name)
+    if genre:
+        query = query.join(artist_genres, artist_genres.c.artist_id == Artist.id) \
+            .join(Genre, Genre.id == artist_genres.c.genre_id) \
+            .filter(Genre.name == genre)
+    return query.order_by(Artist.id)
+
+
+NEARBY_RADIUS_KM = 10
+MAX_NEARBY_RADIUS_KM = 500
+MAX_NEARBY_RESULTS = 100
+
+
+def coordinates_from_form(form):
+    # (latitude, longitude) from optional form fields; both or neither
+    try:
+        latitude, longitude = float(form['latitude']), float(form['longitude'])
+    except (KeyError, ValueError):
+        return None, None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None, None
+    return latitude, longitude
+
+
+def venues_near(lat, lon, radius_km, limit):
+    hits = nearby(db.session, Venue, (
+        Venue.id,
+        Venue.name,
+        Venue.city,
+        Venue.state,
+        Venue.latitude,
+        Venue.longitude,
+        Venue.upcoming_show_count.label('num_upcoming_shows')
+    ), lat, lon, radius_km, limit)
+    return {
+        'count': len(hits),
+        'data': [{
+            'id': row.id,
+            'name': row.name,
+            'city': row.city,
+            'state': row.state,
+            'latitude': row.latitude,
+            'longitude': row.longitude,
+            'distance_km': round(distance, 3),
+            'num_upcoming_shows': row.num_upcoming_shows
+        } for row, distance in hits]
+    }
+
+
+def split_shows(shows, now):
+    # partition show dicts into (past, upcoming) against a single `now`
+    past, upcoming = [], []
+    for show in shows:
+        (upcoming if show['start_time'] > now else past).append(show)
+    return past, upcoming
+
+
+VENUE_DETAIL_COLUMNS = (
+    Venue.id,
+    Venue.name,
+    Venue.city,
+    Venue.state,
+    Venue.address,
+    Venue.phone,
+    Venue.image_link,
+    Venue.facebook_link,
+)
+
+
+def load_venue_detail(venue_id, now=None):
+    # venue, its shows and their artists in one query; returns a plain dict
+    # view-model (or None) so no ORM instance is loaded or modified
+    now = now or dt.datetime.now()
+    rows = db.session.query(
+        *VENUE_DETAIL_COLUMNS,
+        Show.artist_id,
+        Show.start_time,
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link')
+    ).outerjoin(Show, Show.venue_id == Venue.id) \
+        .outerjoin(Artist, Artist.id == Show.artist_id) \
+        .filter(Venue.id == venue_id) \
+        .order_by(Show.start_time).all()
+    if not rows:
+        return None
+
+    venue = {column.key: getattr(rows[0], column.key) for column in VENUE_DETAIL_COLUMNS}
+    shows = [{
+        'artist_id': row.artist_id,
+        'artist_name': row.artist_name,
+        'artist_image_link': row.artist_image_link,
+        'start_time': row.start_time
+    } for row in rows if row.start_time is not None]
+    venue['past_shows'], venue['upcoming_shows'] = split_shows(shows, now)
+    venue['past_shows_count'] = len(venue['past_shows'])
+    venue['upcoming_shows_count'] = len(venue['upcoming_shows'])
+    return venue
+
+
+ARTIST_DETAIL_COLUMNS = (
+    Artist.id,
+    Artist.name,
+    Artist.city,
+    Artist.state,
+    Artist.phone,
+    Artist.website,
+    Artist.image_link,
+    Artist.facebook_link,
+    Artist.seeking_venue,
+    Artist.seeking_description,
+)
+
+
+def load_artist_detail(artist_id, now=None):
+    # artist, its shows and their venues in one query, plus one indexed lookup
+    # for genre names so they don't multiply the show rows; returns a plain
+    # dict view-model (or None) like load_venue_detail
+    now = now or dt.datetime.now()
+    rows = db.session.query(
+        *ARTIST_DETAIL_COLUMNS,
+        Show.venue_id,
+        Show.start_time,
+        Venue.name.label('venue_name'),
+        Venue.image_link.label('venue_image_link')
+    ).outerjoin(Show, Show.artist_id == Artist.id) \
+        .outerjoin(Venue, Venue.id == Show.venue_id) \
+        .filter(Artist.id == artist_id) \
+        .order_by(Show.start_time).all()
+    if not rows:
+        return None
+
+    artist = {column.key: getattr(rows[0], column.key) for column in ARTIST_DETAIL_COLUMNS}
+    artist['genres'] = [name for name, in db.session.query(Genre.name)
+                        .join(artist_genres, artist_genres.c.genre_id == Genre.id)
+                        .filter(artist_genres.c.artist_id == artist_id)
+                        .order_by(Genre.name)]
+    shows = [{
+        'venue_id': row.venue_id,
+        'venue_name': row.venue_name,
+        'venue_image_link': row.venue_image_link,
+        'start_time': row.start_time
+    } for row in rows if row.start_time is not None]
+    artist['past_shows'], artist['upcoming_shows'] = split_shows(shows, now)
+    artist['past_shows_count'] = len(artist['past_shows'])
+    artist['upcoming_shows_count'] = len(artist['upcoming_shows'])
+    return artist
+
+
+MAX_SHOWS_PER_PAGE = 500
+
+
+def show_cursor(start_time, show_id):
+    return f'{start_time.isoformat()}_{show_id}'
+
+
+def parse_show_cursor(cursor):
+    # inverse of show_cursor; raises ValueError on a malformed cursor
+    if not cursor:
+        return None
+    start_time, _, show_id = cursor.rpartition('_')
+    return dt.datetime.fromisoformat(start_time), int(show_id)
+
+
+def show_listing_query():
+    # only the columns shows.html renders, artist and venue joined in
+    return db.session.query(
+        Show.id,
+        Show.start_time,
+        Show.artist_id,
+        Show.venue_id,
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link'),
+        Venue.name.label('venue_name')
+    ).join(Artist, Artist.id == Show.artist_id).join(Venue, Venue.id == Show.venue_id)
+
+
+def show_listing_item(row):
+    return {
+        'venue_id': row.venue_id,
+        'venue_name': row.venue_name,
+        'artist_id': row.artist_id,
+        'artist_name': row.artist_name,
+        'artist_image_link': row.artist_image_link,
+        'start_time': row.start_time
+    }
+
+
+# postgres SQLSTATE for a violated exclusion constraint
+EXCLUSION_VIOLATION = '23P01'
+
+
+def booking_conflicts(venue_id, artist_id, start_time, duration):
+    # shows of the venue or the artist overlapping [start_time, start_time +
+    # duration). No show runs longer than MAX_SHOW_MINUTES, so only shows
+    # starting within that much before the new one can overlap it: two range
+    # seeks on the (venue_id, start_time) / (artist_id, start_time) indexes,
+    # whatever the number of shows
+    end_time = start_time + dt.timedelta(minutes=duration)
+    candidates = db.session.query(Show.id, Show.venue_id, Show.artist_id, Show.start_time, Show.duration) \
+        .filter(db.or_(Show.venue_id == venue_id, Show.artist_id == artist_id)) \
+        .filter(Show.start_time > start_time - dt.timedelta(minutes=MAX_SHOW_MINUTES),
+                Show.start_time < end_time) \
+        .order_by(Show.start_time).all()
+    return [show for show in candidates if show.start_time + dt.timedelta(minutes=show.duration) > start_time]
+
+
+MAX_FREE_SLOT_DAYS = 366
+
+
+def free_slots(venue_id, start, end, min_minutes=0, opens=0, closes=24):
+    # gaps of at least min_minutes between the venue's shows in [start, end),
+    # within its daily opening hours [opens, closes); one indexed range read
+    # and a single sweep over the shows found
+    booked = db.session.query(Show.start_time, Show.duration) \
+        .filter(Show.venue_id == venue_id,
+                Show.start_time > start - dt.timedelta(minutes=MAX_SHOW_MINUTES),
+                Show.start_time < end) \
+        .order_by(Show.start_time).all()
+    booked = [(show.start_time, show.start_time + dt.timedelta(minutes=show.duration)) for show in booked]
+
+    slots, i = [], 0
+    day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    if closes > 24:
+        # the previous day's window runs past midnight into the range
+        day -= dt.timedelta(days=1)
+    while day < end:
+        cursor = max(start, day + dt.timedelta(hours=opens))
+        window_end = min(end, day + dt.timedelta(hours=closes))
+        # skip shows that ended before this window
+        while i < len(booked) and booked[i][1] <= cursor:
+            i += 1
+        j = i
+        while cursor < window_end:
+            if j < len(booked) and booked[j][0] < window_end:
+                gap_end = booked[j][0]
+                next_cursor = max(cursor, booked[j][1])
+                j += 1
+            else:
+                gap_end, next_cursor = window_end, window_end
+            if gap_end > cursor and gap_end - cursor >= dt.timedelta(minutes=min_minutes):
+                slots.append({'start': cursor, 'end': gap_end})
+            cursor = next_cursor
+        day += dt.timedelta(days=1)
+    return slots
+
+
+def show_keyset_filter(after=None, before=None):
+    # row-value comparison on (start_time, id), so the planner seeks straight
+    # to the cursor in ix_shows_start_time_id instead of scanning up to it
+    if before is not None:
+        return db.tuple_(Show.start_time, Show.id) < db.tuple_(*before)
+    if after is not None:
+        return db.tuple_(Show.start_time, Show.id) > db.tuple_(*after)
+    return None
+
+
+def load_shows_page(after=None, before=None, per_page=30):
+    # keyset page over (start_time, id): one joined query, and one extra row
+    # fetched to detect the next page
+    query = show_listing_query()
+    keyset = show_keyset_filter(after, before)
+    if keyset is not None:
+        query = query.filter(keyset)
+    if before is not None:
+        query = query.order_by(Show.start_time.desc(), Show.id.desc())
+    else:
+        query = query.order_by(Show.start_time, Show.id)
+
+    rows = query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if before is not None:
+        rows.reverse()
+
+    shows = [show_listing_item(row) for row in rows]
+
+    first = show_cursor(rows[0].start_time, rows[0].id) if rows else None
+    last = show_cursor(rows[-1].start_time, rows[-1].id) if rows else None
+    if before is not None:
+        prev_cursor, next_cursor = (first if has_more else None), last
+    else:
+        prev_cursor, next_cursor = (first if after is not None else None), (last if has_more else None)
+    return {'shows': shows, 'next_cursor': next_cursor, 'prev_cursor': prev_cursor}
+
+
+# ---------------------------------------------------------------------------- #
+# Show counters.
+# ---------------------------------------------------------------------------- #
+
+
+COUNTED_MODELS = ((Venue, Show.venue_id), (Artist, Show.artist_id))
+# page cache tag prefix of each counted model's detail page
+COUNTED_TAGS = {Venue: 'venue', Artist: 'artist'}
+
+
+def counter_state():
+    # locked so a concurrent roll can't move the watermark past a show being
+    # inserted; a fresh database starts counting from now, one that already
+    # holds shows needs `flask rebuild-show-counters` first
+    state = ShowCounterState.query.with_for_update().get(1)
+    if state is None:
+        state = ShowCounterState(id=1, rolled_until=dt.datetime.now())
+        db.session.add(state)
+    return state
+
+
+def record_new_show(show):
+    # bump the owning venue/artist counters in the caller's transaction
+    column = 'upcoming_show_count' if show.start_time > counter_state().rolled_until else 'past_show_count'
+    for model, show_fk in COUNTED_MODELS:
+        counter = getattr(model, column)
+        model.query.filter(model.id == getattr(show, show_fk.key)) \
+            .update({counter: counter + 1}, synchronize_session=False)
+
+
+def roll_show_counters(now=None):
+    # move shows that started since the last roll from upcoming to past
+    now = now or dt.datetime.now()
+    state = counter_state()
+    if now <= state.rolled_until:
+        return 0
+
+    moved, tags = 0, []
+    for model, show_fk in COUNTED_MODELS:
+        started = db.session.query(show_fk, db.func.count(Show.id)) \
+            .filter(Show.start_time > state.rolled_until, Show.start_time <= now) \
+            .group_by(show_fk).all()
+        if not started:
+            continue
+        tags.append(model.__tablename__)
+        tags.extend(f'{COUNTED_TAGS[model]}:{parent_id}' for parent_id, _ in started)
+        table = model.__table__
+        db.session.execute(
+            table.update().where(table.c.id == db.bindparam('parent_id')).values(
+                upcoming_show_count=table.c.upcoming_show_count - db.bindparam('started'),
+                past_show_count=table.c.past_show_count + db.bindparam('started')
+            ),
+            [{'parent_id': parent_id, 'started': count} for parent_id, count in started]
+        )
+        # venues and artists see the same started shows
+        moved = sum(count for _, count in started)
+    state.rolled_until = now
+    db.session.commit()
+    # their pages show the counts just moved
+    if tags:
+        page_cache.invalidate(*tags)
+    return moved
+
+
+def rebuild_show_counters(now=None):
+    # recompute every counter from one grouped pass over shows per model
+    now = now or dt.datetime.now()
+    is_upcoming = db.case([(Show.start_time > now, 1)], else_=0)
+    for model, show_fk in COUNTED_MODELS:
+        counts = db.session.query(show_fk, db.func.sum(is_upcoming), db.func.count(Show.id)) \
+            .group_by(show_fk).all()
+        table = model.__table__
+        db.session.execute(table.update().values(upcoming_show_count=0, past_show_count=0))
+        if counts:
+            db.session.execute(
+                table.update().where(table.c.id == db.bindparam('parent_id')).values(
+                    upcoming_show_count=db.bindparam('upcoming'),
+                    past_show_count=db.bindparam('past')
+                ),
+                [{'parent_id': parent_id, 'upcoming': upcoming, 'past': total - upcoming}
+                 for parent_id, upcoming, total in counts]
+            )
+    counter_state().rolled_until = now
+    db.session.commit()
+
+
+@app.cli.command('roll-show-counters')
+def roll_show_counters_command():
+    """Move shows that have started from the upcoming to the past counters."""
+    click.echo(f'{roll_show_counters()} shows moved to past')
+
+
+@app.cli.command('rebuild-show-counters')
+def rebuild_show_counters_command():
+    """Recompute all venue/artist show counters from the shows table."""
+    rebuild_show_counters()
+    click.echo('show counters rebuilt')
+
+
+# ---------------------------------------------------------------------------- #
+# Background tasks.
+# ---------------------------------------------------------------------------- #
+
+
+IMAGE_MODELS = {'venue': Venue, 'artist': Artist}
+
+
+def public_http_url(url):
+    # whether `url` is http(s) with a host that resolves only to public
+    # addresses, so link checks can't be pointed at local files or internal
+    # hosts; a failed lookup raises OSError
+    try:
+        parts = urllib.parse.urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return False
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        return False
+    try:
+        addresses = socket.getaddrinfo(parts.hostname, port, proto=socket.IPPROTO_TCP)
+    except UnicodeError:
+        return False
+    return all(ipaddress.ip_address(address[4][0].split('%')[0]).is_global for address in addresses)
+
+
+class PublicRedirectHandler(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        if not public_http_url(newurl):
+            raise urllib.error.HTTPError(newurl, 403, 'redirect to a non-public URL', headers, fp)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+link_opener = urllib.request.build_opener(PublicRedirectHandler)
+
+
+def image_link_ok(url):
+    # False if the link isn't a public http(s) URL, answers with a client
+    # error or isn't an image; server and network errors raise, so the task
+    # is retried later
+    if not public_http_url(url):
+        return False
+    try:
+        req = urllib.request.Request(url, method='HEAD', headers={'User-Agent': 'fyyur-link-check'})
+        with link_opener.open(req, timeout=app.config['IMAGE_CHECK_TIMEOUT']) as response:
+            return response.headers.get('Content-Type', '').startswith('image/')
+    except urllib.error.HTTPError as e:
+        if 400 <= e.code < 500 and e.code != 429:
+            return False
+        raise
+    except ValueError:
+        # not a URL urllib can request
+        return False
+
+
+@tasks.task
+def validate_image_link(kind, id, url):
+    # drop an image link that doesn't resolve to an image, unless it has been
+    # edited since; the check runs before any database work
+    if image_link_ok(url):
+        return
+    model = IMAGE_MODELS[kind]
+    updated = model.query.filter(model.id == id, model.image_link == url) \
+        .update({model.image_link: None}, synchronize_session=False)
+    if updated:
+        # reaches other processes only through PAGE_CACHE_REDIS_URL; without
+        # it their cached pages keep the link until PAGE_CACHE_TTL runs out
+        invalidate_pages(f'{kind}s', f'{kind}:{id}')
+
+
+@app.cli.command('run-tasks')
+@click.option('--workers', default=2, show_default=True, help='Worker threads.')
+def run_tasks_command(workers):
+    """Run queued background tasks until interrupted."""
+    tasks.start(workers)
+    click.echo(f'running background tasks with {workers} workers, ctrl-c to stop')
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        tasks.stop()
+
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Bundle, fingerprint and precompress static/ into static/dist/."""
+    manifest = build_assets(app.static_folder)
+    assets.load_manifest()
+    click.echo(f'built {len(manifest)} assets into static/dist, restart the app to serve them')
+
+
+# ---------------------------------------------------------------------------- #
+# Bulk import.
+# ---------------------------------------------------------------------------- #
+
+
+IMPORT_SPECS = {
+    'venues': (Venue, VenueForm, ['name', 'city', 'state', 'address', 'phone', 'image_link', 'facebook_link',
+                                  'latitude', 'longitude']),
+    'artists': (Artist, ArtistForm, ['name', 'city', 'state', 'phone', 'genres', 'image_link', 'facebook_link']),
+    'shows': (Show, ShowForm, ['start_time', 'duration']),
+}
+
+
+def load_id_map(model):
+    # source id -> database id, seeded with the ids already in the table
+    return {str(row_id): row_id for (row_id,) in db.session.query(model.id)}
+
+
+def load_bookings(records):
+    # {(kind, id): [(start, end)] sorted} of the existing shows of the venues
+    # and artists of the show `records` that could overlap any of them, read
+    # in one range query over the whole chunk
+    if not records:
+        return {}
+    venue_ids = {record['venue_id'] for record in records}
+    artist_ids = {record['artist_id'] for record in records}
+    earliest = min(record['start_time'] for record in records) - dt.timedelta(minutes=MAX_SHOW_MINUTES)
+    latest = max(record['start_time'] + dt.timedelta(minutes=record['duration']) for record in records)
+    rows = db.session.query(Show.venue_id, Show.artist_id, Show.start_time, Show.duration) \
+        .filter(db.or_(Show.venue_id.in_(venue_ids), Show.artist_id.in_(artist_ids))) \
+        .filter(Show.start_time > earliest, Show.start_time < latest)
+    booked = {}
+    for row in rows:
+        interval = (row.start_time, row.start_time + dt.timedelta(minutes=row.duration))
+        if row.venue_id in venue_ids:
+            booked.setdefault(('venue', row.venue_id), []).append(interval)
+        if row.artist_id in artist_ids:
+            booked.setdefault(('artist', row.artist_id), []).append(interval)
+    for intervals in booked.values():
+        intervals.sort()
+    return booked
+
+
+def import_conflict(record, booked):
+    # why the show `record` can't be booked, or None; `booked` is the
+    # load_bookings result for its chunk, and `record` is added to it when it
+    # fits, so later rows of the chunk are checked against it too
+    start = record['start_time']
+    end = start + dt.timedelta(minutes=record['duration'])
+    keys = (('venue', record['venue_id']), ('artist', record['artist_id']))
+    for key in keys:
+        intervals = booked.get(key, [])
+        # no show runs longer than MAX_SHOW_MINUTES, so only those starting
+        # within that much before `start` can overlap it
+        i = bisect.bisect_left(intervals, (start - dt.timedelta(minutes=MAX_SHOW_MINUTES),))
+        while i < len(intervals) and intervals[i][0] < end:
+            if intervals[i][1] > start:
+                return f'{key[0]} {key[1]} is already booked at {intervals[i][0]:%Y-%m-%d %H:%M}'
+            i += 1
+    for key in keys:
+        bisect.insort(booked.setdefault(key, []), (start, end))
+    return None
+
+
+def insert_shows_one_by_one(lines, batch, rejected):
+    # fallback for a chunk that hit the exclusion constraint: shows booked
+    # since they were checked are rejected instead of failing the import
+    kept = []
+    for line_number, record in zip(lines, batch):
+        try:
+            with db.session.begin_nested():
+                db.session.execute(Show.__table__.insert(), record)
+            kept.append(record)
+        except IntegrityError as e:
+            if getattr(e.orig, 'pgcode', None) != EXCLUSION_VIOLATION:
+                raise
+            rejected.append((line_number, 'venue or artist is already booked at that time'))
+    return kept
+
+
+def import_rows(kind, path, id_maps, chunk_size=CHUNK_SIZE):
+    # returns (rows imported, [(line number, error)], seconds taken)
+    model, form_class, columns = IMPORT_SPECS[kind]
+    id_map = id_maps[kind] = id_maps.get(kind) or load_id_map(model)
+    if kind == 'shows':
+        for parent in ('venues', 'artists'):
+            id_maps[parent] = id_maps.get(parent) or load_id_map(IMPORT_SPECS[parent][0])
+
+    next_id = (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+    imported, rejected = 0, []
+    start = time.perf_counter()
+    for chunk in chunked(read_rows(path), chunk_size):
+        valid = []
+        for line_number, row in chunk:
+            try:
+                data = validate_row(form_class, row)
+                record = {column: data[column] for column in columns}
+                if kind == 'shows':
+                    record['venue_id'] = id_maps['venues'][str(row['venue_id'])]
+                    record['artist_id'] = id_maps['artists'][str(row['artist_id'])]
+                    if record['duration'] is None:
+                        record['duration'] = Show.__table__.c.duration.default.arg
+            except KeyError as e:
+                rejected.append((line_number, f'unknown or missing {e}'))
+                continue
+            except ValueError as e:
+                rejected.append((line_number, str(e)))
+                continue
+            valid.append((line_number, row, record))
+
+        booked = load_bookings([record for _, _, record in valid]) if kind == 'shows' else {}
+        batch, lines, genre_links = [], [], []
+        for line_number, row, record in valid:
+            if kind == 'shows':
+                conflict = import_conflict(record, booked)
+                if conflict:
+                    rejected.append((line_number, conflict))
+                    continue
+            record['id'] = next_id
+            if kind == 'venues':
+                # batched inserts skip the mapper event that sets this
+                has_location = record['latitude'] is not None and record['longitude'] is not None
+                record['geohash'] = geohash_encode(record['latitude'], record['longitude']) if has_location else None
+            if kind == 'artists':
+                genre_links.extend((genre, next_id) for genre in record.pop('genres'))
+            if row.get('id') not in (None, ''):
+                id_map[str(row['id'])] = next_id
+            next_id += 1
+            batch.append(record)
+            lines.append(line_number)
+        try:
+            insert_batch(db.session, model.__table__, batch)
+            if genre_links:
+                genres = {genre.name: genre for genre in genres_by_name({name for name, _ in genre_links})}
+                db.session.flush()
+                insert_batch(db.session, artist_genres, [
+                    {'genre_id': genres[name.strip()].id, 'artist_id': artist_id}
+                    for name, artist_id in genre_links if name.strip()
+                ])
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            if kind != 'shows' or getattr(e.orig, 'pgcode', None) != EXCLUSION_VIOLATION:
+                raise
+            batch = insert_shows_one_by_one(lines, batch, rejected)
+            db.session.commit()
+        imported += len(batch)
+    reset_id_sequence(db.session, model.__table__)
+    db.session.commit()
+    return imported, sorted(rejected), time.perf_counter() - start
+
+
+@app.cli.command('import-data')
+@click.option('--venues', type=click.Path(exists=True, dir_okay=False), help='CSV or JSON Lines file of venues.')
+@click.option('--artists', type=click.Path(exists=True, dir_okay=False), help='CSV or JSON Lines file of artists.')
+@click.option('--shows', type=click.Path(exists=True, dir_okay=False), help='CSV or JSON Lines file of shows.')
+@click.option('--chunk-size', default=CHUNK_SIZE, show_default=True, help='Rows per batched insert.')
+def import_data_command(venues, artists, shows, chunk_size):
+    """Bulk import venues, artists and shows.
+
+    Shows refer to venues/artists by the `id` column of the imported files,
+    or by existing database ids. Shows overlapping another booking of their
+    venue or artist are rejected like any other invalid row.
+    """
+    id_maps = {}
+    for kind, path in (('venues', venues), ('artists', artists), ('shows', shows)):
+        if not path:
+            continue
+        imported, rejected, seconds = import_rows(kind, path, id_maps, chunk_size)
+        rate = imported / seconds if seconds else 0
+        click.echo(f'{kind}: {imported} rows in {seconds:.2f}s ({rate:.0f} rows/sec), {len(rejected)} rejected')
+        for line_number, error in rejected[:20]:
+            click.echo(f'  line {line_number}: {error}', err=True)
+    if shows:
+        rebuild_show_counters()
+    page_cache.invalidate('venues', 'artists', 'shows')
 
 
 # ---------------------------------------------------------------------------- #
@@ -112,77 +929,39 @@ def index():
 
 
 @app.route('/venues')
+@page_cache.cached('venues')
 def venues():
-    all_venues = Venue.query.all()
-
-    # add num_upcoming_shows
-    for venue in all_venues:
-        venue.num_upcoming_shows = \
-            Show.query.filter(Show.venue_id == venue.id).filter(Show.start_time > dt.datetime.now()).count()
-
-    # re-arrange json to pull out city/state to top level
-    data = []
-    for venue in all_venues:
-        city_found = False
-        for entry in data:
-            if entry['city'] == venue.city and entry['state'] == venue.state:
-                city_found = True
-                # update exisiting record
-                entry['venues'].append({
-                    'id': venue.id,
-                    'name': venue.name,
-                    'num_upcoming_shows': venue.num_upcoming_shows
-                })
-        if not city_found:
-            # add new record
-            data.append({
-                'city': venue.city,
-                'state': venue.state,
-                'venues': [{
-                    'id': venue.id,
-                    'name': venue.name,
-                    'num_upcoming_shows': venue.num_upcoming_shows
-                }]
-            })
-
-    return render_template('pages/venues.html', areas=data)
+    rows = venues_with_upcoming_counts()
+    return render_template('pages/venues.html', areas=group_venues_by_area(rows))
 
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
     search_string = request.form.get('search_term', '')
-    filtered_query = Venue.query.filter(Venue.name.ilike('%' + search_string + '%'))
-    venue_count = filtered_query.count()
-    data = filtered_query.all()
-    # adding num_upcoming_shows, even though it looks like form doesn't use it
-    for venue in data:
-        venue.num_upcoming_shows = \
-            Show.query.filter(Show.venue_id == venue.id).filter(Show.start_time > dt.datetime.now()).count()
-    response = {
-        "count": venue_count,
-        "data": data
-    }
+    response = search_by_name(db.session, Venue, Venue.upcoming_show_count.label('num_upcoming_shows'), search_string)
     return render_template('pages/search_venues.html', results=response, search_term=search_string)
 
 
+@app.route('/venues/nearby')
+@app.route('/api/v1/venues/nearby')
+def nearby_venues():
+    # e.g. /venues/nearby?lat=37.77&lon=-122.42&radius=5 (km), nearest first
+    lat = request.args.get('lat', type=float)
+    lon = request.args.get('lon', type=float)
+    if lat is None or lon is None or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return json_response({'error': 'lat and lon are required'}, 400)
+    radius = min(max(request.args.get('radius', NEARBY_RADIUS_KM, float), 0.0), MAX_NEARBY_RADIUS_KM)
+    limit = min(max(request.args.get('limit', 20, int), 1), MAX_NEARBY_RESULTS)
+    return json_response(venues_near(lat, lon, radius, limit))
+
+
 @app.route('/venues/<int:venue_id>')
+@page_cache.cached('venue:{venue_id}', 'artists')
 def show_venue(venue_id):
     # shows the venue page with the given venue_id
-    data = Venue.query.get(venue_id)
-
-    # add past shows, convert datetime to string, add renamed variables for joined data
-    data.past_shows = Show.query.filter(Show.venue_id == venue_id).filter(Show.start_time < dt.datetime.now()).join(Artist)
-    for show in data.past_shows:
-        show.start_time = dt.datetime.strftime(show.start_time, format='%Y-%m-%d %H:%M')
-        show.artist_name = show.artist_show.name
-        show.artist_image_link = show.artist_show.image_link
-
-    data.upcoming_shows = Show.query.filter(Show.venue_id == venue_id).filter(Show.start_time > dt.datetime.now()).join(Artist)
-    for show in data.upcoming_shows:
-        show.start_time = dt.datetime.strftime(show.start_time, format='%Y-%m-%d %H:%M')
-        show.artist_name = show.artist_show.name
-        show.artist_image_link = show.artist_show.image_link
-
+    data = load_venue_detail(venue_id)
+    if data is None:
+        abort(404)
     return render_template('pages/show_venue.html', venue=data)
 
 
@@ -204,30 +983,41 @@ def create_venue_submission():
         state=request.form['state'],
         address=request.form['address'],
         phone=request.form['phone'],
-        # image_link=request.form['image_link'],
+        image_link=request.form.get('image_link') or None,
         facebook_link=request.form['facebook_link']
     )
+    new_venue.latitude, new_venue.longitude = coordinates_from_form(request.form)
 
     try:
         db.session.add(new_venue)
+        db.session.flush()
+        if new_venue.image_link:
+            tasks.enqueue(validate_image_link, kind='venue', id=new_venue.id, url=new_venue.image_link)
+        invalidate_pages('venues')
         db.session.commit()
         flash('Venue ' + new_venue.name + ' was successfully listed!')
-    except:
+    except SQLAlchemyError:
+        db.session.rollback()
+        app.logger.exception('could not create venue %r', new_venue.name)
         flash('An error occurred. Venue ' + new_venue.name + ' could not be listed.')
-    finally:
-        return render_template('pages/home.html')
+    return render_template('pages/home.html')
 
 
 @app.route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
+    venue = Venue.query.get(venue_id)
+    if venue is None:
+        abort(404)
     try:
-        Venue.query.get(venue_id).delete()
+        db.session.delete(venue)
+        invalidate_pages('venues', 'venue:' + venue_id, 'shows')
         db.session.commit()
         flash('Venue id ' + venue_id + ' was successfully deleted!')
-    except:
+    except SQLAlchemyError:
+        db.session.rollback()
+        app.logger.exception('could not delete venue %s', venue_id)
         flash('Error! Venue id ' + venue_id + ' was not deleted!')
-    finally:
-        return render_template('pages/home.html')
+    return render_template('pages/home.html')
     # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
     # clicking that button delete it from the db then redirect the user to the homepage
     # return None
@@ -238,36 +1028,27 @@ def delete_venue(venue_id):
 
 
 @app.route('/artists')
+@page_cache.cached('artists')
 def artists():
-    data = Artist.query.all()
+    # optionally filtered to one genre, e.g. /artists?genre=Jazz
+    data = artists_by_genre(request.args.get('genre')).all()
     return render_template('pages/artists.html', artists=data)
 
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
     search_string = request.form.get('search_term', '')
-    filtered_query = Artist.query.filter(Artist.name.ilike('%' + search_string + '%'))
-    artist_count = filtered_query.count()
-    data = filtered_query.all()
-    # adding num_upcoming_shows, even though it looks like form doesn't use it
-    for artist in data:
-        artist.num_upcoming_shows = \
-            Show.query.filter(Show.artist_id == artist.id).filter(Show.start_time > dt.datetime.now()).count()
-    response = {
-        "count": artist_count,
-        "data": data
-    }
-    return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+    response = search_by_name(db.session, Artist, Artist.upcoming_show_count.label('num_upcoming_shows'), search_string)
+    return render_template('pages/search_artists.html', results=response, search_term=search_string)
 
 
 @app.route('/artists/<int:artist_id>')
+@page_cache.cached('artist:{artist_id}', 'venues')
 def show_artist(artist_id):
-    # shows the venue page with the given venue_id
-    data = Artist.query.get(artist_id)
-    try:
-        data.genres = data.genres.split(',')
-    except:
-        print('Could not split list of genres')
+    # shows the artist page with the given artist_id
+    data = load_artist_detail(artist_id)
+    if data is None:
+        abort(404)
     return render_template('pages/show_artist.html', artist=data)
 
 
@@ -284,22 +1065,23 @@ def edit_artist(artist_id):
 
 @app.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
-    # Only the first genre comes in through the post request
     artist = Artist.query.get(artist_id)
     artist.name = request.form['name']
     artist.city = request.form['city']
     artist.state = request.form['state']
     artist.phone = request.form['phone']
-    artist.genres = request.form['genres']
+    artist.genres = genres_by_name(request.form.getlist('genres'))
     artist.facebook_link = request.form['facebook_link']
 
     try:
+        invalidate_pages('artists', f'artist:{artist_id}')
         db.session.commit()
         flash('Artist ' + artist.name + ' was successfully updated!')
-    except:
-        flash('An error occurred. Artist ' + artist.name + ' was not updated!')
-    finally:
-        return redirect(url_for('show_artist', artist_id=artist_id))
+    except SQLAlchemyError:
+        db.session.rollback()
+        app.logger.exception('could not update artist %s', artist_id)
+        flash('An error occurred. Artist ' + request.form['name'] + ' was not updated!')
+    return redirect(url_for('show_artist', artist_id=artist_id))
 
 
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
@@ -316,16 +1098,21 @@ def edit_venue_submission(venue_id):
     venue.city = request.form['city']
     venue.state = request.form['state']
     venue.address = request.form['address']
+    latitude, longitude = coordinates_from_form(request.form)
+    if latitude is not None:
+        venue.latitude, venue.longitude = latitude, longitude
     # venue.genres = request.form['genres']
     venue.facebook_link = request.form['facebook_link']
 
     try:
+        invalidate_pages('venues', f'venue:{venue_id}')
         db.session.commit()
         flash('Venue ' + venue.name + ' was successfully updated!')
-    except:
-        flash('An error occurred. Venue ' + venue.name + ' was not updated!')
-    finally:
-        return redirect(url_for('show_venue', venue_id=venue_id))
+    except SQLAlchemyError:
+        db.session.rollback()
+        app.logger.exception('could not update venue %s', venue_id)
+        flash('An error occurred. Venue ' + request.form['name'] + ' was not updated!')
+    return redirect(url_for('show_venue', venue_id=venue_id))
 
 
 # Create Artist
@@ -340,26 +1127,30 @@ def create_artist_form():
 @app.route('/artists/create', methods=['POST'])
 def create_artist_submission():
     # called upon submitting the new artist listing form
-    # Only the first genre comes through the post request
-    print(request.form['genres'], flush=True)
     new_artist = Artist(
         name=request.form['name'],
         city=request.form['city'],
         state=request.form['state'],
         phone=request.form['phone'],
-        genres=request.form['genres'],
+        genres=genres_by_name(request.form.getlist('genres')),
+        image_link=request.form.get('image_link') or None,
         facebook_link=request.form['facebook_link'],
     )
     try:
         db.session.add(new_artist)
+        db.session.flush()
+        if new_artist.image_link:
+            tasks.enqueue(validate_image_link, kind='artist', id=new_artist.id, url=new_artist.image_link)
+        invalidate_pages('artists')
         db.session.commit()
         # on successful db insert, flash success
         flash('Artist ' + new_artist.name + ' was successfully listed!')
-    except:
+    except SQLAlchemyError:
         # on unsuccessful db insert, flash an error instead.
+        db.session.rollback()
+        app.logger.exception('could not create artist %r', new_artist.name)
         flash('An error occurred. Artist ' + new_artist.name + ' could not be listed.')
-    finally:
-        return render_template('pages/home.html')
+    return render_template('pages/home.html')
 
 
 # Shows
@@ -367,16 +1158,18 @@ def create_artist_submission():
 
 
 @app.route('/shows')
+@page_cache.cached('shows', 'venues', 'artists')
 def shows():
-    # displays list of shows at /shows
-
-    data = Show.query.outerjoin(Artist).outerjoin(Venue)
-    for show in data:
-        show.start_time = dt.datetime.strftime(show.start_time, format='%Y-%m-%d %H:%M')
-        show.venue_name = show.venue_show.name
-        show.artist_name = show.artist_show.name
-        show.artist_image_link = show.artist_show.image_link
-    return render_template('pages/shows.html', shows=data)
+    # displays list of shows at /shows, one keyset page at a time
+    per_page = max(1, min(request.args.get('per_page', app.config['SHOWS_PER_PAGE'], int), MAX_SHOWS_PER_PAGE))
+    try:
+        after = parse_show_cursor(request.args.get('after'))
+        before = parse_show_cursor(request.args.get('before'))
+    except ValueError:
+        abort(400)
+    page = load_shows_page(after=after, before=before, per_page=per_page)
+    return render_template('pages/shows.html', shows=page['shows'], per_page=per_page,
+                           next_cursor=page['next_cursor'], prev_cursor=page['prev_cursor'])
 
 
 @app.route('/shows/create')
@@ -390,21 +1183,112 @@ def create_shows():
 def create_show_submission():
     # called to create new shows in the db, upon submitting new show listing form
     # insert form data as a new Show record in the db
-    new_show = Show(
-        artist_id=request.form['artist_id'],
-        venue_id=request.form['venue_id'],
-        start_time=request.form['start_time']
-    )
     try:
+        new_show = Show(
+            artist_id=int(request.form['artist_id']),
+            venue_id=int(request.form['venue_id']),
+            start_time=dateutil.parser.parse(request.form['start_time']),
+            duration=request.form.get('duration', 180, type=int)
+        )
+        if not 0 < new_show.duration <= MAX_SHOW_MINUTES:
+            raise ValueError(f'duration {new_show.duration} out of range')
+        conflicts = booking_conflicts(new_show.venue_id, new_show.artist_id, new_show.start_time, new_show.duration)
+        if conflicts:
+            flash('Show could not be listed: the venue or artist is already booked at '
+                  + conflicts[0].start_time.strftime('%Y-%m-%d %H:%M') + '.')
+            return render_template('pages/home.html')
         db.session.add(new_show)
+        db.session.flush()
+        # counted in the insert transaction, under the counter_state lock, so
+        # a concurrent roll sees the show either counted or not yet inserted
+        record_new_show(new_show)
+        invalidate_pages('shows', 'venues', f'venue:{new_show.venue_id}', f'artist:{new_show.artist_id}')
         db.session.commit()
         # on successful db insert, flash success
         flash('Show was successfully listed!')
-    except:
+    except IntegrityError as e:
+        db.session.rollback()
+        if getattr(e.orig, 'pgcode', None) == EXCLUSION_VIOLATION:
+            # booked by a concurrent request since the check above
+            flash('Show could not be listed: the venue or artist is already booked at that time.')
+        else:
+            app.logger.exception('could not create show')
+            flash('An error occurred. Show could not be listed.')
+    except (SQLAlchemyError, KeyError, ValueError, OverflowError):
         # on unsuccessful db insert, flash an error instead.
+        db.session.rollback()
+        app.logger.exception('could not create show')
         flash('An error occurred. Show could not be listed.')
-    finally:
-        return render_template('pages/home.html')
+    return render_template('pages/home.html')
+
+
+# JSON API
+# ----------------------------------------------------------------
+
+
+@app.route('/api/v1/venues')
+def api_venues():
+    # streamed one area at a time, see streaming.py
+    return stream_json(iter_venue_areas(venues_with_upcoming_counts().yield_per(YIELD_PER)))
+
+
+@app.route('/api/v1/venues/<int:venue_id>')
+@page_cache.cached('venue:{venue_id}', 'artists')
+def api_venue(venue_id):
+    data = load_venue_detail(venue_id)
+    if data is None:
+        return json_response({'error': 'venue not found'}, 404)
+    return json_response(data)
+
+
+@app.route('/api/v1/venues/<int:venue_id>/free-slots')
+def api_venue_free_slots(venue_id):
+    # e.g. ?from=2026-11-01&to=2026-11-08&minutes=180&opens=18&closes=26
+    try:
+        start = dateutil.parser.parse(request.args['from'])
+        end = dateutil.parser.parse(request.args['to'])
+    except (KeyError, ValueError, OverflowError):
+        return json_response({'error': 'from and to must be dates or datetimes'}, 400)
+    if not start < end <= start + dt.timedelta(days=MAX_FREE_SLOT_DAYS):
+        return json_response({'error': f'the range must be positive and at most {MAX_FREE_SLOT_DAYS} days'}, 400)
+    opens = request.args.get('opens', 0, int)
+    closes = request.args.get('closes', 24, int)
+    if not 0 <= opens < closes <= opens + 24:
+        return json_response({'error': 'opening hours must satisfy 0 <= opens < closes <= opens + 24'}, 400)
+    if Venue.query.get(venue_id) is None:
+        return json_response({'error': 'venue not found'}, 404)
+    slots = free_slots(venue_id, start, end, request.args.get('minutes', 0, int), opens, closes)
+    return json_response({'venue_id': venue_id, 'count': len(slots), 'data': slots})
+
+
+@app.route('/api/v1/typeahead/<any(artists, venues):kind>')
+@page_cache.cached('{kind}')
+def api_typeahead(kind):
+    # picker options for names starting with ?q=, e.g. /api/v1/typeahead/artists?q=blu
+    model = Artist if kind == 'artists' else Venue
+    limit = min(max(request.args.get('limit', TYPEAHEAD_LIMIT, int), 1), 50)
+    return json_response({'data': prefix_search(db.session, model, request.args.get('q', ''), limit)})
+
+
+@app.route('/api/v1/artists')
+def api_artists():
+    rows = artists_by_genre(request.args.get('genre')).yield_per(YIELD_PER)
+    return stream_json({'id': row.id, 'name': row.name} for row in rows)
+
+
+@app.route('/api/v1/artists/<int:artist_id>')
+@page_cache.cached('artist:{artist_id}', 'venues')
+def api_artist(artist_id):
+    data = load_artist_detail(artist_id)
+    if data is None:
+        return json_response({'error': 'artist not found'}, 404)
+    return json_response(data)
+
+
+@app.route('/api/v1/shows')
+def api_shows():
+    rows = show_listing_query().order_by(Show.start_time, Show.id).yield_per(YIELD_PER)
+    return stream_json(show_listing_item(row) for row in rows)
 
 
 @app.errorhandler(404)
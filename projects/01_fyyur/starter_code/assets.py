@@ -0,0 +1,207 @@
+"""Bundled, fingerprinted static assets.
+
+`flask build-assets` concatenates and minifies each bundle in BUNDLES,
+copies every other file under static/, and writes everything to static/dist/
+under a name carrying a hash of its content (main.3f2a9c1e.css), along with
+.gz (and, if the brotli package is installed, .br) copies and a
+manifest.json mapping source names to built ones. url() references in
+stylesheets are rewritten to the built names. rcssmin/rjsmin are used for
+minifying when installed; otherwise CSS comments and whitespace are stripped
+and JavaScript is only concatenated.
+
+Templates call asset_url() exactly like url_for('static', filename=...), and
+asset_urls() for a bundle. Once a manifest exists they return the built
+names, which never change content, so those files are served with a
+one-year immutable Cache-Control and, when the client accepts it, straight
+from their precompressed copy. Without a manifest (e.g. in development)
+everything falls back to the source files and bundles expand to their parts.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+
+from flask import request, send_from_directory, url_for
+
+BUNDLES = {
+    'bundles/main.css': [
+        'css/bootstrap.min.css',
+        'css/layout.main.css',
+        'css/main.css',
+        'css/main.responsive.css',
+        'css/main.quickfix.css',
+    ],
+    'bundles/head.js': [
+        'js/libs/modernizr-2.8.2.min.js',
+        'js/libs/moment.min.js',
+    ],
+    'bundles/app.js': [
+        'js/libs/bootstrap-3.1.1.min.js',
+        'js/plugins.js',
+        'js/script.js',
+    ],
+}
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+COMPRESSIBLE = ('.css', '.js', '.svg', '.map', '.json', '.txt', '.eot', '.ttf', '.otf')
+MAX_AGE = 365 * 24 * 3600
+
+CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+
+def fingerprint(path, content):
+    root, ext = posixpath.splitext(path)
+    return f'{root}.{hashlib.sha256(content).hexdigest()[:8]}{ext}'
+
+
+def minify_css(source):
+    try:
+        import rcssmin
+        return rcssmin.cssmin(source)
+    except ImportError:
+        pass
+    # keep /*! license */ comments
+    source = re.sub(r'/\*(?!!).*?\*/', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    return re.sub(r'\s*([{};:,>])\s*', r'\1', source).strip()
+
+
+def minify_js(source):
+    try:
+        import rjsmin
+        return rjsmin.jsmin(source)
+    except ImportError:
+        return source
+
+
+def rewrite_css_urls(source, path, manifest):
+    # point url() references, relative to the stylesheet at `path`, at the
+    # built files (or at the source file if it wasn't built)
+    def replace(match):
+        url = match.group(2)
+        if url.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+            return match.group(0)
+        target, suffix = re.match(r'([^?#]*)(.*)', url).groups()
+        target = posixpath.normpath(posixpath.join(posixpath.dirname(path), target))
+        built = manifest.get(target)
+        return f'url("{posixpath.join("/static", DIST, built) if built else "/static/" + target}{suffix}")'
+    return CSS_URL.sub(replace, source)
+
+
+def _compress(path, content):
+    with gzip.open(path + '.gz', 'wb', compresslevel=9) as f:
+        f.write(content)
+    try:
+        import brotli
+    except ImportError:
+        return
+    with open(path + '.br', 'wb') as f:
+        f.write(brotli.compress(content))
+
+
+def build(static_folder, bundles=BUNDLES):
+    # returns the manifest {source name: built name}
+    dist = os.path.join(static_folder, DIST)
+    shutil.rmtree(dist, ignore_errors=True)
+    manifest = {}
+
+    def write(name, content):
+        built = fingerprint(name, content)
+        path = os.path.join(dist, built)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+        if built.endswith(COMPRESSIBLE):
+            _compress(path, content)
+        manifest[name] = built
+
+    def read(name):
+        with open(os.path.join(static_folder, name), 'rb') as f:
+            return f.read()
+
+    # plain files first, so stylesheets can refer to their built names
+    stylesheets = []
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != dist]
+        for filename in files:
+            name = os.path.relpath(os.path.join(root, filename), static_folder).replace(os.sep, '/')
+            if filename.startswith('.'):
+                continue
+            if name.endswith('.css'):
+                stylesheets.append(name)
+            else:
+                write(name, read(name))
+    for name in stylesheets:
+        source = rewrite_css_urls(read(name).decode('utf-8'), name, manifest)
+        write(name, source.encode('utf-8'))
+
+    for bundle, parts in bundles.items():
+        if bundle.endswith('.css'):
+            source = '\n'.join(minify_css(rewrite_css_urls(read(part).decode('utf-8'), part, manifest))
+                               for part in parts)
+        else:
+            # `;` guards against a part that doesn't end its last statement
+            source = '\n;'.join(minify_js(read(part).decode('utf-8')) for part in parts)
+        write(bundle, source.encode('utf-8'))
+
+    with open(os.path.join(dist, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+class Assets(object):
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.bundles = BUNDLES
+        self.dist = os.path.join(app.static_folder, DIST)
+        self.manifest = {}
+        self.load_manifest()
+        app.jinja_env.globals['asset_url'] = self.url
+        app.jinja_env.globals['asset_urls'] = self.urls
+        app.view_functions['static'] = self.send_static
+        app.extensions['assets'] = self
+
+    def load_manifest(self):
+        path = os.path.join(self.dist, MANIFEST)
+        if os.path.exists(path):
+            with open(path) as f:
+                self.manifest = json.load(f)
+        self.built = set(self.manifest.values())
+
+    def url(self, endpoint, **values):
+        # url_for, with static files swapped for their built copies
+        if endpoint == 'static' and values.get('filename') in self.manifest:
+            values['filename'] = posixpath.join(DIST, self.manifest[values['filename']])
+        return url_for(endpoint, **values)
+
+    def urls(self, bundle):
+        if bundle in self.manifest or bundle not in self.bundles:
+            return [self.url('static', filename=bundle)]
+        return [self.url('static', filename=part) for part in self.bundles[bundle]]
+
+    def send_static(self, filename):
+        built = filename[len(DIST) + 1:] if filename.startswith(DIST + '/') else None
+        if built not in self.built:
+            return self.app.send_static_file(filename)
+
+        accepted = request.accept_encodings
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if accepted[encoding] and os.path.exists(os.path.join(self.dist, built + suffix)):
+                response = send_from_directory(self.dist, built + suffix,
+                                               mimetype=mimetypes.guess_type(built)[0], cache_timeout=MAX_AGE)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(self.dist, built, cache_timeout=MAX_AGE)
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
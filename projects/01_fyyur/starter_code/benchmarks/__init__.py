@@ -0,0 +1,16 @@
+"""Benchmarks for the Fyyur app.
+
+Run from the starter_code directory, e.g. `python -m benchmarks.bench_venues`.
+DATABASE_URL defaults to an in-memory SQLite database so nothing touches the
+development postgres database unless asked to. The page cache and the debug
+query budget are off unless PAGE_CACHE_TTL / QUERY_BUDGET say otherwise, so
+numbers reflect the work each view really does, and background tasks run
+inline so their work is measured with the request that queued them.
+"""
+import os
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('PAGE_CACHE_TTL', '0')
+os.environ.setdefault('QUERY_BUDGET', '0')
+os.environ.setdefault('TASK_BACKEND', 'memory')
+os.environ.setdefault('TASK_WORKERS', '0')
@@ -0,0 +1,60 @@
+"""Compare the cached `datetime` filter with the old parse-every-call filter.
+
+    python -m benchmarks.bench_datetime --values 5000 --distinct 500
+"""
+import argparse
+import datetime as dt
+import random
+import time
+
+import babel.dates
+import dateutil.parser
+
+from formatting import format_datetime
+
+
+def legacy_format_datetime(value, format='medium'):
+    # the filter as it was: views stringified start_time and it parsed it back
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format)
+
+
+def timed(label, func, values, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for value in values:
+            func(value, 'full')
+        best = min(best, time.perf_counter() - start)
+    print(f'{label}: {best * 1000:.1f}ms for {len(values)} values '
+          f'({best / len(values) * 1e6:.1f}us each)')
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--values', type=int, default=5000)
+    parser.add_argument('--distinct', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    base = dt.datetime(2020, 1, 1, 20, 0)
+    distinct = [base + dt.timedelta(hours=rng.randint(0, 24 * 365)) for _ in range(args.distinct)]
+    values = [rng.choice(distinct) for _ in range(args.values)]
+
+    for value in distinct:
+        assert format_datetime(value, 'full') == \
+            legacy_format_datetime(value.strftime('%Y-%m-%d %H:%M'), 'full')
+
+    legacy = timed('legacy', legacy_format_datetime, [v.strftime('%Y-%m-%d %H:%M') for v in values], args.repeat)
+    cached = timed('cached', format_datetime, values, args.repeat)
+    print(f'speedup: {legacy / cached:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
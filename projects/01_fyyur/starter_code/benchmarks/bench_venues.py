@@ -0,0 +1,32 @@
+"""Seed N venues/shows and measure the /venues listing.
+
+    python -m benchmarks.bench_venues --venues 10000 --shows 100000
+"""
+import argparse
+
+from app import app
+from benchmarks.synthetic import seed
+from benchmarks.utils import count_queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--venues', type=int, default=1000)
+    parser.add_argument('--artists', type=int, default=1000)
+    parser.add_argument('--shows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with app.app_context():
+        seed(args.venues, args.artists, args.shows)
+        client = app.test_client()
+        client.get('/venues')  # warm up
+        for _ in range(args.repeat):
+            with count_queries() as stats:
+                response = client.get('/venues')
+            print(f"/venues status={response.status_code} queries={stats['queries']} "
+                  f"latency={stats['seconds'] * 1000:.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
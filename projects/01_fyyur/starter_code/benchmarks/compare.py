@@ -0,0 +1,36 @@
+"""Compare two benchmarks.run result files route by route.
+
+    python -m benchmarks.compare before.json after.json
+"""
+import json
+import sys
+
+METRICS = ['p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request']
+
+
+def change(before, after):
+    if not before or after is None:
+        return f'{before} -> {after}'
+    return f'{before} -> {after} ({(after - before) / before * 100:+.0f}%)'
+
+
+def main(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print(f"{before['meta'].get('commit')} -> {after['meta'].get('commit')}")
+    for route in sorted(set(before['routes']) | set(after['routes'])):
+        old, new = before['routes'].get(route), after['routes'].get(route)
+        if old is None or new is None:
+            print(f'{route}: only in {before_path if new is None else after_path}')
+            continue
+        print(route)
+        for metric in METRICS:
+            print(f'  {metric:20} {change(old.get(metric), new.get(metric))}')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit(__doc__)
+    main(sys.argv[1], sys.argv[2])
@@ -0,0 +1,75 @@
+"""Query-plan check for the lookups the views depend on.
+
+    python -m benchmarks.plans
+
+Runs EXPLAIN (postgres) or EXPLAIN QUERY PLAN (SQLite) for each lookup and
+reports whether the plan reads an index. benchmarks.run stores the same
+report in its JSON output.
+"""
+import datetime as dt
+
+from app import db, Venue, Artist, Show, show_keyset_filter
+from search import prefix_query, TYPEAHEAD_LIMIT
+
+INDEX_MARKERS = ('Index Scan', 'Index Only Scan', 'Bitmap Index Scan', 'USING INDEX', 'USING COVERING INDEX',
+                 'USING INTEGER PRIMARY KEY', 'USING PRIMARY KEY')
+
+
+def lookups(now):
+    return {
+        'venue_upcoming_shows': db.session.query(Show.id, Show.start_time)
+            .filter(Show.venue_id == 1, Show.start_time > now).order_by(Show.start_time),
+        'artist_upcoming_shows': db.session.query(Show.id, Show.start_time)
+            .filter(Show.artist_id == 1, Show.start_time > now).order_by(Show.start_time),
+        # the predicate load_shows_page runs for ?after=<cursor>
+        'shows_keyset_page': db.session.query(Show.id, Show.start_time)
+            .filter(show_keyset_filter(after=(now, 1))).order_by(Show.start_time, Show.id).limit(30),
+        'booking_conflicts': db.session.query(Show.id)
+            .filter(db.or_(Show.venue_id == 1, Show.artist_id == 1))
+            .filter(Show.start_time > now - dt.timedelta(hours=12), Show.start_time < now),
+        'venues_in_area': db.session.query(Venue.id)
+            .filter(Venue.state == 'CA', Venue.city == 'San Francisco'),
+        'artist_by_name': db.session.query(Artist.id).filter(Artist.name == 'Blue Room 1'),
+        # /api/v1/typeahead/artists?q=blu
+        'artist_typeahead': prefix_query(db.session, Artist, 'blu').limit(TYPEAHEAD_LIMIT),
+        # the geohash fallback of /venues/nearby, one prefix range per cell
+        'venues_nearby': db.session.query(Venue.id).filter(Venue.geohash.between('9q8yy', '9q8yy~')),
+    }
+
+
+def explain(query):
+    connection = db.session.connection()
+    compiled = query.statement.compile(dialect=connection.dialect)
+    if connection.dialect.name == 'postgresql':
+        rows = connection.execute('EXPLAIN ' + str(compiled), compiled.params)
+    else:
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+        rows = connection.execute('EXPLAIN QUERY PLAN ' + str(compiled), params)
+    return '\n'.join(str(row[-1]) for row in rows)
+
+
+def check_plans(now=None):
+    # {name: {'uses_index': bool, 'plan': str}}
+    now = now or dt.datetime.now()
+    report = {}
+    for name, query in lookups(now).items():
+        plan = explain(query)
+        report[name] = {
+            'uses_index': any(marker in plan for marker in INDEX_MARKERS),
+            'plan': plan,
+        }
+    return report
+
+
+def main():
+    from app import app
+    with app.app_context():
+        db.create_all()
+        for name, result in check_plans().items():
+            print(f"{name}: {'index' if result['uses_index'] else 'NO INDEX'}")
+            for line in result['plan'].splitlines():
+                print(f'    {line}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+"""Load-test every Fyyur route against synthetic data.
+
+    python -m benchmarks.run --scale 100k --requests 50 --output bench.json
+    python -m benchmarks.run --database-url postgresql://localhost/fyyur_bench --scale 1m --wsgi
+
+Each route is requested --requests times (after one warm-up request) through
+the Flask test client, or over HTTP against a local WSGI server with --wsgi.
+Latency percentiles, statements per request (read from the Server-Timing
+header), the process's peak RSS and the query-plan check from
+benchmarks.plans are written to a JSON file with stable key order, so two
+runs can be compared with `python -m benchmarks.compare`.
+"""
+import argparse
+import datetime as dt
+import itertools
+import json
+import os
+import platform
+import random
+import re
+import resource
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+SERVER_TIMING_QUERIES = re.compile(r'db;desc="(\d+) queries"')
+SCALES = {
+    '1k': 1000,
+    '10k': 10000,
+    '100k': 100000,
+    '1m': 1000000,
+    '10m': 10000000,
+}
+
+
+def scale_counts(num_shows):
+    # (venues, artists, shows) for a given number of shows
+    return max(10, num_shows // 20), max(10, num_shows // 10), num_shows
+
+
+def percentile(samples, pct):
+    # nearest-rank percentile of an already sorted list
+    index = max(0, int(round(pct / 100.0 * len(samples))) - 1)
+    return samples[min(index, len(samples) - 1)]
+
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def routes(rng, num_venues, num_artists):
+    # (name, method, path factory, form data factory) for every route in app.py;
+    # DELETE /venues/<id> is left out as it would shrink the data set mid-run
+    venue = lambda: rng.randint(1, num_venues)
+    artist = lambda: rng.randint(1, num_artists)
+    word = lambda: rng.choice(['blue', 'room', 'velvet', 'hall', 'owls', 'neon', 'xyz'])
+    venue_form = lambda: {'name': f'Bench Venue {rng.random()}', 'city': 'Austin', 'state': 'TX',
+                          'address': '1 Main St', 'phone': '512-555-0100', 'genres': 'Jazz',
+                          'facebook_link': 'https://www.facebook.com/bench'}
+    artist_form = lambda: {'name': f'Bench Artist {rng.random()}', 'city': 'Austin', 'state': 'TX',
+                           'phone': '512-555-0100', 'genres': 'Jazz',
+                           'facebook_link': 'https://www.facebook.com/bench'}
+    # each submitted show gets its own daytime hour, clear of the seeded evening
+    # shows and of each other, so the route measures inserts, not rejections
+    show_hours = itertools.count()
+    today = dt.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def show_form():
+        day, hour = divmod(next(show_hours), 10)
+        start_time = today + dt.timedelta(days=day + 1, hours=6 + hour)
+        return {'artist_id': artist(), 'venue_id': venue(), 'duration': 60,
+                'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S')}
+
+    def free_slots_path():
+        start = dt.date.today() + dt.timedelta(days=rng.randint(0, 60))
+        end = start + dt.timedelta(days=7)
+        return f'/api/v1/venues/{venue()}/free-slots?from={start}&to={end}&minutes=120&opens=18&closes=26'
+
+    return [
+        ('index', 'GET', lambda: '/', None),
+        ('venues', 'GET', lambda: '/venues', None),
+        ('search_venues', 'POST', lambda: '/venues/search', lambda: {'search_term': word()}),
+        ('show_venue', 'GET', lambda: f'/venues/{venue()}', None),
+        ('nearby_venues', 'GET', lambda: f'/venues/nearby?lat={37.77 + rng.uniform(-0.1, 0.1):.4f}'
+                                         f'&lon={-122.42 + rng.uniform(-0.1, 0.1):.4f}&radius=5', None),
+        ('create_venue_form', 'GET', lambda: '/venues/create', None),
+        ('artists', 'GET', lambda: '/artists', None),
+        ('artists_by_genre', 'GET', lambda: '/artists?genre=Jazz', None),
+        ('search_artists', 'POST', lambda: '/artists/search', lambda: {'search_term': word()}),
+        ('show_artist', 'GET', lambda: f'/artists/{artist()}', None),
+        ('edit_artist', 'GET', lambda: f'/artists/{artist()}/edit', None),
+        ('edit_venue', 'GET', lambda: f'/venues/{venue()}/edit', None),
+        ('create_artist_form', 'GET', lambda: '/artists/create', None),
+        ('shows', 'GET', lambda: '/shows', None),
+        ('create_shows', 'GET', lambda: '/shows/create', None),
+        ('api_venues', 'GET', lambda: '/api/v1/venues', None),
+        ('api_venue', 'GET', lambda: f'/api/v1/venues/{venue()}', None),
+        ('api_venue_free_slots', 'GET', free_slots_path, None),
+        ('api_artists', 'GET', lambda: '/api/v1/artists', None),
+        ('api_artist', 'GET', lambda: f'/api/v1/artists/{artist()}', None),
+        ('api_shows', 'GET', lambda: '/api/v1/shows', None),
+        ('api_typeahead', 'GET', lambda: f'/api/v1/typeahead/artists?q={word()}', None),
+        ('create_venue_submission', 'POST', lambda: '/venues/create', venue_form),
+        ('create_artist_submission', 'POST', lambda: '/artists/create', artist_form),
+        ('create_show_submission', 'POST', lambda: '/shows/create', show_form),
+        ('edit_artist_submission', 'POST', lambda: f'/artists/{artist()}/edit', artist_form),
+        ('edit_venue_submission', 'POST', lambda: f'/venues/{venue()}/edit', venue_form),
+    ]
+
+
+class TestClientDriver(object):
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        return response.status_code, response.headers.get('Server-Timing', '')
+
+
+class WSGIDriver(object):
+    def __init__(self, app):
+        from werkzeug.serving import make_server
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.base = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode('utf-8') if data is not None else None
+        req = urllib.request.Request(self.base + path, data=body, method=method)
+        try:
+            with urllib.request.urlopen(req) as response:
+                response.read()
+                return response.status, response.headers.get('Server-Timing', '')
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers.get('Server-Timing', '')
+
+    def close(self):
+        self.server.shutdown()
+
+
+def measure(driver, method, path_factory, data_factory, count):
+    driver.request(method, path_factory(), data_factory() if data_factory else None)  # warm up
+    latencies, queries, statuses = [], [], {}
+    for _ in range(count):
+        path = path_factory()
+        data = data_factory() if data_factory else None
+        start = time.perf_counter()
+        status, server_timing = driver.request(method, path, data)
+        latencies.append((time.perf_counter() - start) * 1000)
+        match = SERVER_TIMING_QUERIES.search(server_timing)
+        if match:
+            queries.append(int(match.group(1)))
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    latencies.sort()
+    return {
+        'requests': count,
+        'status': statuses,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'max_ms': round(latencies[-1], 2),
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+        'max_queries': max(queries) if queries else None,
+        'peak_rss_kb': peak_rss_kb(),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=sorted(SCALES, key=SCALES.get), default='1k',
+                        help='number of shows to generate')
+    parser.add_argument('--database-url', help='defaults to an in-memory SQLite database')
+    parser.add_argument('--requests', type=int, default=30, help='timed requests per route')
+    parser.add_argument('--routes', help='comma-separated route names to run (default: all)')
+    parser.add_argument('--wsgi', action='store_true', help='drive a local WSGI server over HTTP')
+    parser.add_argument('--skip-seed', action='store_true', help='reuse the data already in the database')
+    parser.add_argument('--output', default='bench_results.json')
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+
+    # app reads DATABASE_URL at import time
+    from app import app, db
+    from benchmarks.plans import check_plans
+    from benchmarks.synthetic import seed
+
+    num_venues, num_artists, num_shows = scale_counts(SCALES[args.scale])
+    with app.app_context():
+        if not args.skip_seed:
+            start = time.perf_counter()
+            seed(num_venues, num_artists, num_shows)
+            print(f'seeded {num_venues} venues, {num_artists} artists, {num_shows} shows '
+                  f'in {time.perf_counter() - start:.1f}s')
+        dialect = db.engine.dialect.name
+        plans = check_plans()
+    for name, plan in plans.items():
+        print(f"plan {name:24} {'index' if plan['uses_index'] else 'NO INDEX'}")
+
+    rng = random.Random(1)
+    selected = set(args.routes.split(',')) if args.routes else None
+    driver = WSGIDriver(app) if args.wsgi else TestClientDriver(app)
+    results = {}
+    try:
+        for name, method, path_factory, data_factory in routes(rng, num_venues, num_artists):
+            if selected and name not in selected:
+                continue
+            results[name] = measure(driver, method, path_factory, data_factory, args.requests)
+            r = results[name]
+            print(f"{name:26} p50={r['p50_ms']:8.2f}ms p95={r['p95_ms']:8.2f}ms p99={r['p99_ms']:8.2f}ms "
+                  f"queries={r['queries_per_request']} status={r['status']}")
+    finally:
+        if args.wsgi:
+            driver.close()
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'database': dialect,
+            'driver': 'wsgi' if args.wsgi else 'test_client',
+            'scale': args.scale,
+            'venues': num_venues,
+            'artists': num_artists,
+            'shows': num_shows,
+            'requests_per_route': args.requests,
+            'peak_rss_kb': peak_rss_kb(),
+        },
+        'plans': plans,
+        'routes': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write('\n')
+    print(f'wrote {args.output}')
+
+
+if __name__ == '__main__':
+    main()
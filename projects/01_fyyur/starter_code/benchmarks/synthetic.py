@@ -0,0 +1,186 @@
+"""Synthetic venues, artists and shows at benchmark scale.
+
+Rows are generated lazily and written in batches (COPY on postgres), so 10M
+shows never sit in memory at once. Venue and artist popularity is skewed the
+way real listings are: a small number of venues host most of the shows.
+Shows fill fixed evening slots, each venue and artist at most once per slot,
+so no venue or artist is ever double-booked. Everything is derived from a seeded RNG, so the same scale always produces
+the same data.
+"""
+import datetime as dt
+import random
+from itertools import islice
+
+from sqlalchemy import text
+
+from app import db, Venue, Artist, Show, Genre, artist_genres, rebuild_show_counters
+from geo import geohash_encode
+from importer import insert_batch, reset_id_sequence
+
+CITIES = [
+    ('San Francisco', 'CA', 6),
+    ('New York', 'NY', 8),
+    ('Los Angeles', 'CA', 6),
+    ('Austin', 'TX', 4),
+    ('Seattle', 'WA', 3),
+    ('Chicago', 'IL', 4),
+    ('Nashville', 'TN', 3),
+    ('New Orleans', 'LA', 2),
+    ('Portland', 'OR', 2),
+    ('Denver', 'CO', 2),
+]
+CITY_CENTRES = {
+    'San Francisco': (37.7749, -122.4194),
+    'New York': (40.7128, -74.0060),
+    'Los Angeles': (34.0522, -118.2437),
+    'Austin': (30.2672, -97.7431),
+    'Seattle': (47.6062, -122.3321),
+    'Chicago': (41.8781, -87.6298),
+    'Nashville': (36.1627, -86.7816),
+    'New Orleans': (29.9511, -90.0715),
+    'Portland': (45.5152, -122.6784),
+    'Denver': (39.7392, -104.9903),
+}
+GENRES = [
+    'Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk', 'Funk', 'Hip-Hop',
+    'Heavy Metal', 'Instrumental', 'Jazz', 'Musical Theatre', 'Pop', 'Punk', 'R&B', 'Reggae',
+    'Rock n Roll', 'Soul', 'Other',
+]
+ADJECTIVES = ['Blue', 'Velvet', 'Golden', 'Silent', 'Electric', 'Crimson', 'Lucky', 'Wild', 'Broken', 'Neon']
+NOUNS = ['Room', 'Owls', 'Lantern', 'Harbor', 'Garden', 'Foxes', 'Anchor', 'Tigers', 'Cellar', 'Comets']
+VENUE_KINDS = ['Hall', 'Club', 'Lounge', 'Theatre', 'Bar', 'Ballroom']
+BATCH_SIZE = 10000
+# evening show slots, back to back so shows in different slots never overlap
+SHOW_SLOTS = [dt.timedelta(hours=18), dt.timedelta(hours=21)]
+SHOW_MINUTES = 180
+SHOW_DAYS = 730
+SKEWED_DRAWS = 20
+
+
+def _name(rng, i, suffix=''):
+    return f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}{suffix} {i}'
+
+
+def _city(rng):
+    return rng.choices(CITIES, weights=[weight for _, _, weight in CITIES])[0][:2]
+
+
+def _skewed_id(rng, count):
+    # squaring a uniform draw favours low ids: the top 10% get ~30% of shows
+    return int(count * rng.random() ** 2) + 1
+
+
+def _unused_id(rng, count, used):
+    # a skewed id not in `used`, or a uniform one once the popular ids are taken
+    for _ in range(SKEWED_DRAWS):
+        candidate = _skewed_id(rng, count)
+        if candidate not in used:
+            break
+    else:
+        candidate = rng.randint(1, count)
+        while candidate in used:
+            candidate = rng.randint(1, count)
+    used.add(candidate)
+    return candidate
+
+
+def venue_rows(rng, count):
+    for i in range(1, count + 1):
+        city, state = _city(rng)
+        # scattered up to ~15km around the city centre
+        lat, lon = (round(c + rng.uniform(-0.15, 0.15), 6) for c in CITY_CENTRES[city])
+        yield {
+            'id': i,
+            'name': _name(rng, i, ' ' + rng.choice(VENUE_KINDS)),
+            'city': city,
+            'state': state,
+            'address': f'{rng.randint(1, 9999)} {rng.choice(NOUNS)} St',
+            'phone': f'{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(1000, 9999)}',
+            'image_link': f'https://images.example.com/venues/{i}.jpg',
+            'facebook_link': f'https://www.facebook.com/venue{i}',
+            'latitude': lat,
+            'longitude': lon,
+            'geohash': geohash_encode(lat, lon),
+            'upcoming_show_count': 0,
+            'past_show_count': 0,
+        }
+
+
+def artist_rows(rng, count):
+    for i in range(1, count + 1):
+        city, state = _city(rng)
+        yield {
+            'id': i,
+            'name': _name(rng, i),
+            'city': city,
+            'state': state,
+            'phone': f'{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(1000, 9999)}',
+            'website': f'https://artist{i}.example.com',
+            'image_link': f'https://images.example.com/artists/{i}.jpg',
+            'facebook_link': f'https://www.facebook.com/artist{i}',
+            'seeking_venue': rng.random() < 0.3,
+            'seeking_description': None,
+            'upcoming_show_count': 0,
+            'past_show_count': 0,
+        }
+
+
+def artist_genre_rows(rng, num_artists):
+    for artist_id in range(1, num_artists + 1):
+        for genre_id in rng.sample(range(1, len(GENRES) + 1), rng.randint(1, 3)):
+            yield {'genre_id': genre_id, 'artist_id': artist_id}
+
+
+def show_rows(rng, count, num_venues, num_artists, now):
+    # evening shows spread over two years either side of `now`, taking the
+    # slots in random order; within a slot no venue or artist repeats
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    slots = [today + dt.timedelta(days=day) + start
+             for day in range(-SHOW_DAYS, SHOW_DAYS + 1) for start in SHOW_SLOTS]
+    per_slot, extra = divmod(count, len(slots))
+    if per_slot + (extra > 0) > min(num_venues, num_artists):
+        raise ValueError(f'{count} shows do not fit {num_venues} venues and {num_artists} artists')
+    rng.shuffle(slots)
+    show_id = 0
+    for n, start_time in enumerate(slots):
+        venues, artists = set(), set()
+        for _ in range(per_slot + (n < extra)):
+            show_id += 1
+            yield {
+                'id': show_id,
+                'venue_id': _unused_id(rng, num_venues, venues),
+                'artist_id': _unused_id(rng, num_artists, artists),
+                'start_time': start_time,
+                'duration': SHOW_MINUTES,
+            }
+
+
+def _write(table, rows):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, BATCH_SIZE))
+        if not batch:
+            break
+        insert_batch(db.session, table, batch)
+        db.session.commit()
+
+
+def seed(num_venues, num_artists, num_shows, rng=None, now=None):
+    # drop and recreate the schema, then fill it; counters are rebuilt at `now`
+    rng = rng or random.Random(0)
+    now = now or dt.datetime.now()
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    _write(Genre.__table__, [{'id': i, 'name': name} for i, name in enumerate(GENRES, start=1)])
+    _write(Venue.__table__, venue_rows(rng, num_venues))
+    _write(Artist.__table__, artist_rows(rng, num_artists))
+    _write(artist_genres, artist_genre_rows(rng, num_artists))
+    _write(Show.__table__, show_rows(rng, num_shows, num_venues, num_artists, now))
+    for model in (Genre, Venue, Artist, Show):
+        reset_id_sequence(db.session, model.__table__)
+    db.session.commit()
+    rebuild_show_counters(now)
+    if db.session.get_bind().dialect.name == 'postgresql':
+        db.session.execute(text('ANALYZE'))
+        db.session.commit()
@@ -0,0 +1,24 @@
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from app import db
+
+
+@contextmanager
+def count_queries():
+    # yields a dict that is filled with the number of statements executed
+    # and the elapsed wall time once the block exits
+    stats = {'queries': 0, 'seconds': 0.0}
+
+    def before_cursor_execute(*args):
+        stats['queries'] += 1
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    start = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        stats['seconds'] = time.perf_counter() - start
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
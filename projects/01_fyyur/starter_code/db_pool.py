@@ -0,0 +1,136 @@
+"""Connection pool settings and statistics.
+
+Every gunicorn worker gets its own pool, so the database sees up to
+workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections. The DB_POOL_* settings
+size that pool, recycle connections before a proxy or failover silently drops
+them, and ping each connection on checkout so a stale socket is replaced
+instead of failing the request. DB_STATEMENT_TIMEOUT_MS caps how long any one
+statement may run on postgres. SQLite keeps Flask-SQLAlchemy's own pool
+choice, since QueuePool options don't apply to it.
+
+GET /_stats/pool reports the worker's pool occupancy and how long requests
+waited for a connection, which is what to look at before resizing. Outside
+debug mode it needs ?token=POOL_STATS_TOKEN, and is off if no token is set.
+"""
+import os
+import threading
+import time
+
+from flask import abort, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+
+
+class PoolMonitor(object):
+    def __init__(self, app=None, db=None):
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        app.config.setdefault('DB_POOL_SIZE', 5)
+        app.config.setdefault('DB_MAX_OVERFLOW', 10)
+        app.config.setdefault('DB_POOL_TIMEOUT', 30)
+        app.config.setdefault('DB_POOL_RECYCLE', 1800)
+        app.config.setdefault('DB_POOL_PRE_PING', True)
+        app.config.setdefault('DB_STATEMENT_TIMEOUT_MS', 0)
+        app.config.setdefault('POOL_STATS_TOKEN', None)
+        self.app = app
+        self.db = db
+        self.token = app.config['POOL_STATS_TOKEN']
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.checkouts = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0
+        self.connects = 0
+        self.invalidations = 0
+
+        url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+        if url.drivername != 'sqlite':
+            options = self.engine_options(app.config, url)
+            # explicit SQLALCHEMY_ENGINE_OPTIONS still win
+            options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+            app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+        app.add_url_rule('/_stats/pool', 'pool_stats', self.stats_view)
+        app.extensions['pool_monitor'] = self
+
+    def engine_options(self, config, url):
+        monitor = self
+
+        class MonitoredQueuePool(QueuePool):
+            def _do_get(self):
+                start = time.perf_counter()
+                try:
+                    return super(MonitoredQueuePool, self)._do_get()
+                except PoolTimeout:
+                    monitor._record_timeout()
+                    raise
+                finally:
+                    monitor._record_wait(time.perf_counter() - start)
+
+        event.listen(MonitoredQueuePool, 'connect', self._on_connect)
+        event.listen(MonitoredQueuePool, 'invalidate', self._on_invalidate)
+
+        options = {
+            'poolclass': MonitoredQueuePool,
+            'pool_size': config['DB_POOL_SIZE'],
+            'max_overflow': config['DB_MAX_OVERFLOW'],
+            'pool_timeout': config['DB_POOL_TIMEOUT'],
+            'pool_recycle': config['DB_POOL_RECYCLE'],
+            'pool_pre_ping': config['DB_POOL_PRE_PING'],
+        }
+        if config['DB_STATEMENT_TIMEOUT_MS'] and url.drivername.startswith('postgresql'):
+            options['connect_args'] = {'options': f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT_MS']}"}
+        return options
+
+    def _record_wait(self, elapsed):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_time += elapsed
+            self.max_wait = max(self.max_wait, elapsed)
+
+    def _record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def stats(self):
+        pool = self.db.engine.pool
+        stats = {
+            'pid': os.getpid(),
+            'pool': type(pool).__name__,
+            'status': pool.status(),
+            'uptime_s': round(time.time() - self.started, 1),
+        }
+        if isinstance(pool, QueuePool):
+            with self._lock:
+                stats.update({
+                    'size': pool.size(),
+                    'max_overflow': pool._max_overflow,
+                    'checked_in': pool.checkedin(),
+                    'checked_out': pool.checkedout(),
+                    'overflow': pool.overflow(),
+                    'checkouts': self.checkouts,
+                    'avg_wait_ms': round(self.wait_time / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                    'max_wait_ms': round(self.max_wait * 1000, 3),
+                    'timeouts': self.timeouts,
+                    'connects': self.connects,
+                    'invalidations': self.invalidations,
+                })
+        return stats
+
+    def stats_view(self):
+        if not self.app.debug and (not self.token or request.args.get('token') != self.token):
+            abort(404)
+        return jsonify(self.stats())
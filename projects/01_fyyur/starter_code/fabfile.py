@@ -13,6 +13,12 @@ def test():
         abort("Aborted at user request.")
 
 
+def benchmark(scale='10k'):
+    local(
+        "python -m benchmarks.run --scale {} --output bench_results.json".format(scale)
+    )
+
+
 def commit():
     message = raw_input("Enter a git commit message: ")
     local("git add . && git commit -am '{}'".format(message))
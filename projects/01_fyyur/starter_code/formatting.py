@@ -0,0 +1,37 @@
+"""Datetime formatting for the `datetime` Jinja filter.
+
+The filter runs once per show on every listing, so Babel patterns and locales
+are compiled once per (format, locale) and formatted values are memoized;
+shows cluster on a handful of start times.
+"""
+import datetime as dt
+from functools import lru_cache
+
+import babel.dates
+import dateutil.parser
+from babel import Locale
+
+FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+
+@lru_cache(maxsize=64)
+def compiled_pattern(format, locale=None):
+    # (DateTimePattern, Locale) for a named or custom format
+    pattern = babel.dates.parse_pattern(FORMATS.get(format, format))
+    return pattern, Locale.parse(locale or babel.dates.LC_TIME)
+
+
+@lru_cache(maxsize=8192)
+def _format(value, format, locale):
+    pattern, locale = compiled_pattern(format, locale)
+    return pattern.apply(value, locale)
+
+
+def format_datetime(value, format='medium', locale=None):
+    # accepts datetimes directly; strings are still parsed for older callers
+    if not isinstance(value, dt.datetime):
+        value = dateutil.parser.parse(value)
+    return _format(value, format, locale)
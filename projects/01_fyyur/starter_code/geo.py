@@ -0,0 +1,133 @@
+"""Venue coordinates and "venues near me" lookups.
+
+With PostGIS installed (migration e8b2f6a4c1d7 creates the extension when the
+server offers it), nearby venues come from a GiST index on the venue's
+geography point: ST_DWithin bounds the search and the `<->` operator walks
+the index in distance order.
+
+Everywhere else (SQLite, or postgres without PostGIS) each venue also stores
+the geohash of its coordinates in an indexed column, kept current by mapper
+events. A lookup picks the geohash precision whose cells are at least as
+large as the radius, so the circle lies within the 3x3 block of cells around
+its centre. It then reads those nine prefix ranges off the btree index and
+ranks the candidates by haversine distance in Python. Either way the cost is
+an index seek plus the venues actually near the point, not a scan of the
+table.
+"""
+import math
+
+from sqlalchemy import event, func, or_, text
+
+GEOHASH_PRECISION = 9
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+_postgis = {}
+
+
+def geohash_encode(lat, lon, precision=GEOHASH_PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        # bits alternate longitude, latitude, starting with longitude
+        value, bounds = (lon, lon_range) if even else (lat, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        if value >= mid:
+            bits = bits * 2 + 1
+            bounds[0] = mid
+        else:
+            bits = bits * 2
+            bounds[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits, bit_count = 0, 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    # (height, width) of a geohash cell in degrees
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def covering_prefixes(lat, lon, radius_km):
+    # geohash prefixes of the 3x3 cells around (lat, lon) at the finest
+    # precision whose cells are no smaller than radius_km
+    farthest_lat = min(89.9, abs(lat) + radius_km / KM_PER_DEGREE)
+    precision = 1
+    for p in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(p)
+        if min(height * KM_PER_DEGREE, width * KM_PER_DEGREE * math.cos(math.radians(farthest_lat))) >= radius_km:
+            precision = p
+            break
+    height, width = cell_size(precision)
+    prefixes = set()
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            cell_lat = max(-90.0, min(90.0, lat + dy * height))
+            cell_lon = (lon + dx * width + 180.0) % 360.0 - 180.0
+            prefixes.add(geohash_encode(cell_lat, cell_lon, precision))
+    return sorted(prefixes)
+
+
+def register_geohash(model):
+    # keep model.geohash in step with model.latitude/longitude on ORM writes
+    def set_geohash(mapper, connection, target):
+        if target.latitude is None or target.longitude is None:
+            target.geohash = None
+        else:
+            target.geohash = geohash_encode(target.latitude, target.longitude)
+    event.listen(model, 'before_insert', set_geohash)
+    event.listen(model, 'before_update', set_geohash)
+
+
+def has_postgis(session):
+    bind = session.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return False
+    if bind.url not in _postgis:
+        _postgis[bind.url] = session.execute(
+            text("SELECT 1 FROM pg_extension WHERE extname = 'postgis'")
+        ).first() is not None
+    return _postgis[bind.url]
+
+
+def geography(lat, lon):
+    # must match the expression index in migration e8b2f6a4c1d7
+    return func.geography(func.ST_SetSRID(func.ST_MakePoint(lon, lat), 4326))
+
+
+def nearby(session, model, columns, lat, lon, radius_km, limit):
+    # (row, distance_km) pairs for the `limit` rows of `model` closest to
+    # (lat, lon) and within radius_km, nearest first
+    if has_postgis(session):
+        point = geography(lat, lon)
+        location = geography(model.latitude, model.longitude)
+        rows = session.query(*columns, (func.ST_Distance(location, point) / 1000.0).label('distance_km')) \
+            .filter(model.latitude.isnot(None), model.longitude.isnot(None)) \
+            .filter(func.ST_DWithin(location, point, radius_km * 1000.0)) \
+            .order_by(location.op('<->')(point)).limit(limit).all()
+        return [(row, row.distance_km) for row in rows]
+
+    ranges = [
+        model.geohash.between(prefix, prefix + '~')
+        for prefix in covering_prefixes(lat, lon, radius_km)
+    ]
+    candidates = session.query(*columns, model.latitude, model.longitude).filter(or_(*ranges)).all()
+    hits = []
+    for row in candidates:
+        distance = haversine_km(lat, lon, row.latitude, row.longitude)
+        if distance <= radius_km:
+            hits.append((row, distance))
+    hits.sort(key=lambda hit: hit[1])
+    return hits[:limit]
@@ -0,0 +1,90 @@
+"""Bulk import helpers behind the `flask import-data` command.
+
+Rows are streamed from CSV or JSON Lines files, validated with the same WTForms
+classes the create pages use, and written in chunks: COPY on postgres, one
+executemany INSERT per chunk elsewhere. Ids are allocated up front from the
+table's current max id so shows can be pointed at freshly imported venues and
+artists without reading anything back; this assumes nothing else inserts into
+the table while an import runs.
+"""
+import csv
+import io
+import json
+import os
+from itertools import islice
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from werkzeug.datastructures import MultiDict
+
+CHUNK_SIZE = 5000
+
+
+def read_rows(path):
+    # yields (line number, dict) pairs without loading the whole file
+    with open(path, newline='', encoding='utf-8') as f:
+        if os.path.splitext(path)[1].lower() == '.csv':
+            for line_number, row in enumerate(csv.DictReader(f), start=2):
+                yield line_number, row
+        else:
+            for line_number, line in enumerate(f, start=1):
+                if line.strip():
+                    yield line_number, json.loads(line)
+
+
+def chunked(iterable, size=CHUNK_SIZE):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def validate_row(form_class, row):
+    # returns the form's coerced data, or raises ValueError with its errors
+    formdata = MultiDict()
+    for key, value in row.items():
+        if isinstance(value, list):
+            formdata.setlist(key, [str(item) for item in value])
+        elif key == 'genres' and isinstance(value, str):
+            formdata.setlist(key, [genre.strip() for genre in value.split(',') if genre.strip()])
+        elif value is not None:
+            formdata[key] = str(value)
+    form = form_class(formdata=formdata, meta={'csrf': False})
+    if not form.validate():
+        raise ValueError('; '.join(f'{field}: {", ".join(errors)}' for field, errors in form.errors.items()))
+    return form.data
+
+
+def insert_batch(session, table, rows):
+    if not rows:
+        return
+    connection = session.connection()
+    if connection.dialect.name == 'postgresql':
+        columns = list(rows[0])
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(['\\N' if row[column] is None else row[column] for column in columns])
+        buffer.seek(0)
+        statement = f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert(statement, buffer)
+        except connection.dialect.dbapi.Error as e:
+            # errors from the raw cursor aren't wrapped by SQLAlchemy; wrap
+            # them as execute() would, e.g. into IntegrityError for a violated
+            # constraint, with the driver's error (and its pgcode) as .orig
+            raise DBAPIError.instance(statement, None, e, connection.dialect.dbapi.Error) from e
+    else:
+        connection.execute(table.insert(), rows)
+
+
+def reset_id_sequence(session, table):
+    # keep the serial in step with the explicitly allocated ids
+    if session.connection().dialect.name == 'postgresql':
+        session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+            f"(SELECT coalesce(max(id), 1) FROM {table.name}))"
+        ))
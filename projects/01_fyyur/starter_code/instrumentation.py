@@ -0,0 +1,82 @@
+"""Per-request SQL instrumentation.
+
+Counts the statements and database time of every request and reports them,
+with the total request time, in a Server-Timing header (visible in the
+browser's network panel). Statements slower than SLOW_QUERY_MS are logged
+with the view that issued them, to SLOW_QUERY_LOG if set and otherwise to the
+app logger (error.log outside debug mode). In debug mode a request that runs
+more than QUERY_BUDGET statements fails with QueryBudgetExceeded, which makes
+N+1 regressions impossible to miss during development.
+"""
+import logging
+import time
+from logging import Formatter, FileHandler
+
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+class QueryInstrumentation(object):
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SLOW_QUERY_MS', 200)
+        app.config.setdefault('SLOW_QUERY_LOG', None)
+        app.config.setdefault('QUERY_BUDGET', None)
+        self.app = app
+        self.threshold = app.config['SLOW_QUERY_MS'] / 1000.0
+        self.budget = (app.config['QUERY_BUDGET'] or None) if app.debug else None
+
+        if app.config['SLOW_QUERY_LOG']:
+            self.logger = logging.getLogger('fyyur.slow_queries')
+            handler = FileHandler(app.config['SLOW_QUERY_LOG'])
+            handler.setFormatter(Formatter('%(asctime)s %(levelname)s: %(message)s'))
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.WARNING)
+        else:
+            self.logger = app.logger
+
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start_time'].pop()
+        if not has_request_context() or 'query_count' not in g:
+            return
+        g.query_count += 1
+        g.query_time += elapsed
+        if elapsed > self.threshold:
+            self.logger.warning('slow query (%.1fms) in %s: %s', elapsed * 1000, request.endpoint, statement)
+
+    def _before_request(self):
+        g.request_start_time = time.perf_counter()
+        g.query_count = 0
+        g.query_time = 0.0
+
+    def _after_request(self, response):
+        if 'query_count' not in g:
+            return response
+        total = time.perf_counter() - g.request_start_time
+        response.headers.add(
+            'Server-Timing',
+            f'db;desc="{g.query_count} queries";dur={g.query_time * 1000:.1f}, app;dur={total * 1000:.1f}'
+        )
+        if self.budget is not None and g.query_count > self.budget:
+            # the error response passes through here again; don't re-raise
+            count = g.pop('query_count')
+            raise QueryBudgetExceeded(
+                f'{request.endpoint} ran {count} queries, over the budget of {self.budget}'
+            )
+        return response
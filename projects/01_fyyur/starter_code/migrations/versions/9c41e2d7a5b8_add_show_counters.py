@@ -0,0 +1,43 @@
+"""add show counters
+
+Revision ID: 9c41e2d7a5b8
+Revises: 3f9a6c1d2b47
+Create Date: 2026-10-18 10:03:47.117902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c41e2d7a5b8'
+down_revision = '3f9a6c1d2b47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table, fk in [('venues', 'venue_id'), ('artists', 'artist_id')]:
+        op.add_column(table, sa.Column('upcoming_show_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_show_count', sa.Integer(), server_default='0', nullable=False))
+        # backfill, counting against the same instant stored as the watermark below
+        op.execute(f'''
+            UPDATE {table} SET
+                upcoming_show_count = (SELECT count(*) FROM shows
+                    WHERE shows.{fk} = {table}.id AND shows.start_time > LOCALTIMESTAMP),
+                past_show_count = (SELECT count(*) FROM shows
+                    WHERE shows.{fk} = {table}.id AND shows.start_time <= LOCALTIMESTAMP)
+        ''')
+    op.create_table('show_counter_state',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('rolled_until', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute('INSERT INTO show_counter_state (id, rolled_until) VALUES (1, LOCALTIMESTAMP)')
+
+
+def downgrade():
+    op.drop_table('show_counter_state')
+    for table in ['artists', 'venues']:
+        op.drop_column(table, 'past_show_count')
+        op.drop_column(table, 'upcoming_show_count')
@@ -0,0 +1,26 @@
+"""add name prefix indexes
+
+Revision ID: a4d7e2b9c6f1
+Revises: f3c9d1e5a7b2
+Create Date: 2026-10-18 16:41:07.220931
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d7e2b9c6f1'
+down_revision = 'f3c9d1e5a7b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # text_pattern_ops serves LIKE 'x%' whatever the database collation
+    op.execute('CREATE INDEX ix_venues_name_lower_pattern ON venues (lower(name) text_pattern_ops, id)')
+    op.execute('CREATE INDEX ix_artists_name_lower_pattern ON artists (lower(name) text_pattern_ops, id)')
+
+
+def downgrade():
+    op.drop_index('ix_artists_name_lower_pattern', table_name='artists')
+    op.drop_index('ix_venues_name_lower_pattern', table_name='venues')
@@ -0,0 +1,62 @@
+"""normalize artist genres
+
+Revision ID: b7d35f0e8a61
+Revises: 9c41e2d7a5b8
+Create Date: 2026-10-18 11:26:05.902144
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d35f0e8a61'
+down_revision = '9c41e2d7a5b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('genres',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('artist_genres',
+    sa.Column('genre_id', sa.Integer(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['artists.id'], ),
+    sa.ForeignKeyConstraint(['genre_id'], ['genres.id'], ),
+    sa.PrimaryKeyConstraint('genre_id', 'artist_id')
+    )
+    op.create_index('ix_artist_genres_artist_id', 'artist_genres', ['artist_id'], unique=False)
+
+    # backfill from the comma-joined artists.genres strings
+    op.execute('''
+        INSERT INTO genres (name)
+        SELECT DISTINCT trim(g.name)
+        FROM artists CROSS JOIN LATERAL unnest(string_to_array(artists.genres, ',')) AS g(name)
+        WHERE trim(g.name) <> ''
+    ''')
+    op.execute('''
+        INSERT INTO artist_genres (genre_id, artist_id)
+        SELECT DISTINCT genres.id, artists.id
+        FROM artists CROSS JOIN LATERAL unnest(string_to_array(artists.genres, ',')) AS g(name)
+        JOIN genres ON genres.name = trim(g.name)
+    ''')
+    op.drop_column('artists', 'genres')
+
+
+def downgrade():
+    op.add_column('artists', sa.Column('genres', sa.VARCHAR(length=120), autoincrement=False, nullable=True))
+    op.execute('''
+        UPDATE artists SET genres = (
+            SELECT string_agg(genres.name, ',' ORDER BY genres.name)
+            FROM artist_genres JOIN genres ON genres.id = artist_genres.genre_id
+            WHERE artist_genres.artist_id = artists.id
+        )
+    ''')
+    op.drop_index('ix_artist_genres_artist_id', table_name='artist_genres')
+    op.drop_table('artist_genres')
+    op.drop_table('genres')
@@ -0,0 +1,44 @@
+"""add venue locations
+
+Revision ID: e8b2f6a4c1d7
+Revises: d5a1b3c7e902
+Create Date: 2026-10-18 15:48:37.120944
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8b2f6a4c1d7'
+down_revision = 'd5a1b3c7e902'
+branch_labels = None
+depends_on = None
+
+GEOGRAPHY = 'geography(ST_SetSRID(ST_MakePoint(longitude, latitude), 4326))'
+
+
+def postgis_available():
+    return op.get_bind().execute(
+        sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'postgis'")
+    ).first() is not None
+
+
+def upgrade():
+    op.add_column('venues', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('venues', sa.Column('longitude', sa.Float(), nullable=True))
+    op.add_column('venues', sa.Column('geohash', sa.String(length=12), nullable=True))
+    op.create_index('ix_venues_geohash', 'venues', ['geohash'], unique=False)
+    # the geohash index serves nearby lookups without PostGIS; with it, a
+    # GiST index on the venue's geography point does (see geo.py)
+    if postgis_available():
+        op.execute('CREATE EXTENSION IF NOT EXISTS postgis')
+        op.execute(f'CREATE INDEX ix_venues_location ON venues USING gist ({GEOGRAPHY})')
+
+
+def downgrade():
+    op.execute('DROP INDEX IF EXISTS ix_venues_location')
+    op.drop_index('ix_venues_geohash', table_name='venues')
+    op.drop_column('venues', 'geohash')
+    op.drop_column('venues', 'longitude')
+    op.drop_column('venues', 'latitude')
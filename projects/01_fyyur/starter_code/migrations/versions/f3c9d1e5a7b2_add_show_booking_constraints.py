@@ -0,0 +1,40 @@
+"""add show booking constraints
+
+Revision ID: f3c9d1e5a7b2
+Revises: e8b2f6a4c1d7
+Create Date: 2026-10-18 16:31:05.772310
+
+Adds a length to every show, capped at 720 minutes (forms.MAX_SHOW_MINUTES,
+which the overlap checks rely on), and exclusion constraints that stop a
+venue or an artist from being booked for two overlapping shows. The upgrade
+fails if the existing shows already overlap; resolve those first.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c9d1e5a7b2'
+down_revision = 'e8b2f6a4c1d7'
+branch_labels = None
+depends_on = None
+
+# the time a show occupies, as a range the GiST index can test for overlap
+BOOKED = "tsrange(start_time, start_time + duration * interval '1 minute')"
+
+
+def upgrade():
+    op.add_column('shows', sa.Column('duration', sa.Integer(), server_default='180', nullable=False))
+    op.create_check_constraint('ck_shows_duration', 'shows', 'duration BETWEEN 1 AND 720')
+    # btree_gist lets the integer ids share a GiST index with the time range
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    op.execute(f'ALTER TABLE shows ADD CONSTRAINT ex_shows_venue_booking EXCLUDE USING gist (venue_id WITH =, {BOOKED} WITH &&)')
+    op.execute(f'ALTER TABLE shows ADD CONSTRAINT ex_shows_artist_booking EXCLUDE USING gist (artist_id WITH =, {BOOKED} WITH &&)')
+
+
+def downgrade():
+    op.execute('ALTER TABLE shows DROP CONSTRAINT ex_shows_artist_booking')
+    op.execute('ALTER TABLE shows DROP CONSTRAINT ex_shows_venue_booking')
+    op.drop_constraint('ck_shows_duration', 'shows', type_='check')
+    op.drop_column('shows', 'duration')
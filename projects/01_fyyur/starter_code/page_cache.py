@@ -0,0 +1,204 @@
+"""Rendered page cache for the read-heavy Fyyur views.
+
+Pages are cached under their full path plus the current version of every tag
+they depend on (e.g. 'venues', 'venue:3'). Writes bump tag versions instead of
+hunting for keys, so invalidation is O(tags) and stale entries simply age out
+of the LRU. Entries also expire after PAGE_CACHE_TTL seconds, since a show
+moves from upcoming to past without any write; a TTL of 0 disables caching.
+
+Every worker keeps its own LRU. Setting PAGE_CACHE_REDIS_URL shares tag
+versions (so an edit in one gunicorn worker invalidates all of them) and
+rendered pages between workers; without it an in-process LocalBackend stands
+in, which is also what tests run against.
+
+The same tag versions back PageCache.versioned, which caches lookups such as
+form choices until their tag is invalidated.
+
+Writes call invalidate_on_commit() inside their transaction; the tags are
+invalidated by the process that made the write, right after it commits, and
+dropped if it rolls back. Invalidation never goes through the task queue:
+without Redis the versions live in the process, so a worker elsewhere would
+bump its own copy and leave the web process serving stale pages.
+"""
+import functools
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from flask import request, session, make_response
+from sqlalchemy import event
+
+
+class LRUCache(object):
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class LocalBackend(object):
+    # in-process stand-in for a shared backend
+    def __init__(self):
+        self._values = LRUCache(maxsize=4096)
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self._values.get(key)
+
+    def set(self, key, value, ttl):
+        self._values.set(key, value, ttl)
+
+    def get_counters(self, keys):
+        with self._lock:
+            return [self._counters.get(key, 0) for key in keys]
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+
+
+class RedisBackend(object):
+    def __init__(self, url):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self._redis.get(key)
+        return None if value is None else value.decode('utf-8')
+
+    def set(self, key, value, ttl):
+        self._redis.set(key, value, ex=max(int(ttl), 1))
+
+    def get_counters(self, keys):
+        return [int(value or 0) for value in self._redis.mget(keys)]
+
+    def incr(self, key):
+        self._redis.incr(key)
+
+
+class PageCache(object):
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PAGE_CACHE_SIZE', 512)
+        app.config.setdefault('PAGE_CACHE_TTL', 300)
+        app.config.setdefault('PAGE_CACHE_REDIS_URL', None)
+        self.ttl = app.config['PAGE_CACHE_TTL']
+        self.local = LRUCache(app.config['PAGE_CACHE_SIZE'])
+        url = app.config['PAGE_CACHE_REDIS_URL']
+        self.shared = RedisBackend(url) if url else None
+        self.versions = self.shared or LocalBackend()
+        app.extensions['page_cache'] = self
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            self.versions.incr('page-cache:tag:' + tag)
+        if self.shared is None:
+            # with no one else sharing this LRU, free the memory right away
+            self.local.clear()
+
+    def watch(self, db_session):
+        # apply tags queued with invalidate_on_commit once db_session commits
+        event.listen(db_session, 'after_commit', self._after_commit)
+        event.listen(db_session, 'after_transaction_end', self._after_transaction_end)
+
+    def invalidate_on_commit(self, db_session, *tags):
+        db_session.info.setdefault('page_cache_tags', set()).update(tags)
+
+    def _after_commit(self, db_session):
+        tags = db_session.info.pop('page_cache_tags', None)
+        if tags:
+            self.invalidate(*sorted(tags))
+
+    def _after_transaction_end(self, db_session, transaction):
+        # a rolled back write invalidates nothing
+        if transaction.parent is None:
+            db_session.info.pop('page_cache_tags', None)
+
+    def versioned(self, tag, loader):
+        # a cached loader() that reloads only after invalidate(tag), in any
+        # worker sharing the backend
+        state = {'version': None, 'value': None}
+        lock = threading.Lock()
+
+        def lookup():
+            version = self.versions.get_counters(['page-cache:tag:' + tag])[0]
+            with lock:
+                if state['version'] != version:
+                    state['value'], state['version'] = loader(), version
+                return state['value']
+        return lookup
+
+    def _key(self, tags):
+        versions = self.versions.get_counters(['page-cache:tag:' + tag for tag in tags])
+        stamp = ','.join(f'{tag}={version}' for tag, version in zip(tags, versions))
+        return f'page-cache:{request.full_path}|{stamp}'
+
+    def cached(self, *tag_templates):
+        # tag templates are formatted with the view's URL arguments,
+        # e.g. @page_cache.cached('venue:{venue_id}', 'artists')
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(**kwargs):
+                # a pending flash message would be baked into the cached page
+                if not self.ttl or request.method != 'GET' or session.get('_flashes'):
+                    return view(**kwargs)
+
+                key = self._key([template.format(**kwargs) for template in tag_templates])
+                entry = self.local.get(key)
+                if entry is None and self.shared is not None:
+                    entry = self.shared.get(key)
+                    if entry is not None:
+                        entry = json.loads(entry)
+                        self.local.set(key, entry, self.ttl)
+                if entry is None:
+                    response = make_response(view(**kwargs))
+                    if response.status_code != 200:
+                        return response
+                    body = response.get_data(as_text=True)
+                    entry = {
+                        'body': body,
+                        'etag': hashlib.sha1(body.encode('utf-8')).hexdigest(),
+                        'last_modified': int(time.time()),
+                        'mimetype': response.mimetype
+                    }
+                    self.local.set(key, entry, self.ttl)
+                    if self.shared is not None:
+                        self.shared.set(key, json.dumps(entry), self.ttl)
+
+                response = make_response(entry['body'])
+                response.mimetype = entry['mimetype']
+                response.set_etag(entry['etag'])
+                response.last_modified = entry['last_modified']
+                response.cache_control.no_cache = True
+                return response.make_conditional(request)
+            return wrapper
+        return decorator
@@ -0,0 +1,120 @@
+"""Name search for venues and artists.
+
+On postgres the `name ILIKE '%term%'` filter is served by the pg_trgm GIN
+indexes from migration 3f9a6c1d2b47 and hits are ranked by trigram similarity.
+SQLite has no pg_trgm, so every searchable table gets an FTS5 shadow table with
+the trigram tokenizer, created with the table and kept in sync by triggers,
+and hits are ranked by bm25.
+
+Typeahead prefix lookups match `lower(name) LIKE 'term%'` on both backends
+and read a range of an index on lower(name) in name order, stopping after
+`limit` rows: on postgres a text_pattern_ops btree (migration a4d7e2b9c6f1),
+whose order ORDER BY ... USING ~<~ follows; on SQLite a plain index, created
+with the table.
+"""
+from sqlalchemy import DDL, event, func, literal_column, table, column
+
+SEARCH_LIMIT = 50
+TYPEAHEAD_LIMIT = 10
+
+# FTS5's trigram tokenizer cannot match terms shorter than one trigram
+MIN_FTS_TERM = 3
+
+
+def fts_create_statements(table_name):
+    fts = f'{table_name}_fts'
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"name, content='{table_name}', content_rowid='id', tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table_name} BEGIN "
+        f"INSERT INTO {fts}(rowid, name) VALUES (new.id, new.name); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table_name} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, name) VALUES ('delete', old.id, old.name); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF name ON {table_name} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, name) VALUES ('delete', old.id, old.name); "
+        f"INSERT INTO {fts}(rowid, name) VALUES (new.id, new.name); END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def fts_drop_statements(table_name):
+    return [f'DROP TABLE IF EXISTS {table_name}_fts']
+
+
+def register_fts_index(sa_table):
+    # create/drop the FTS5 shadow table alongside `sa_table` on SQLite
+    for statement in fts_create_statements(sa_table.name):
+        event.listen(sa_table, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+    for statement in fts_drop_statements(sa_table.name):
+        event.listen(sa_table, 'before_drop', DDL(statement).execute_if(dialect='sqlite'))
+
+
+def register_prefix_index(sa_table):
+    # index lower(name) for prefix_search, on tables made by create_all
+    index = f'ix_{sa_table.name}_name_lower'
+    event.listen(sa_table, 'after_create', DDL(
+        f'CREATE INDEX IF NOT EXISTS {index} ON {sa_table.name} (lower(name))'
+    ).execute_if(dialect='sqlite'))
+    event.listen(sa_table, 'after_create', DDL(
+        f'CREATE INDEX IF NOT EXISTS {index}_pattern ON {sa_table.name} (lower(name) text_pattern_ops, id)'
+    ).execute_if(dialect='postgresql'))
+
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search_by_name(session, model, upcoming_count, term, limit=SEARCH_LIMIT):
+    # one query returning (id, name, num_upcoming_shows, total) rows, best hit
+    # first; `upcoming_count` is the model's upcoming_show_count counter column
+    # labelled num_upcoming_shows, and total is the match count before the limit
+    term = term.strip()
+    query = session.query(
+        model.id,
+        model.name,
+        upcoming_count,
+        func.count().over().label('total')
+    )
+
+    dialect = session.get_bind().dialect.name
+    if dialect == 'sqlite' and len(term) >= MIN_FTS_TERM:
+        fts = table(f'{model.__tablename__}_fts', column('rowid'), column('name'))
+        phrase = '"' + term.replace('"', '""') + '"'
+        query = query.join(fts, fts.c.rowid == model.id) \
+            .filter(literal_column(fts.name).op('MATCH')(phrase)) \
+            .order_by(literal_column(f'{fts.name}.rank'), model.id)
+    else:
+        query = query.filter(model.name.ilike('%' + _escape_like(term) + '%', escape='\\'))
+        if dialect == 'postgresql' and term:
+            query = query.order_by(func.similarity(model.name, term).desc(), model.id)
+        else:
+            query = query.order_by(model.name, model.id)
+
+    rows = query.limit(limit).all()
+    return {
+        'count': rows[0].total if rows else 0,
+        'data': [{
+            'id': row.id,
+            'name': row.name,
+            'num_upcoming_shows': row.num_upcoming_shows
+        } for row in rows]
+    }
+
+
+def prefix_query(session, model, prefix):
+    # (id, name) rows whose name starts with `prefix`, case-insensitively, in
+    # the order of the lower(name) index
+    prefix = prefix.strip().lower()
+    lower_name = func.lower(model.name)
+    query = session.query(model.id, model.name)
+    if session.get_bind().dialect.name == 'postgresql':
+        # ~<~ is the text_pattern_ops ordering, so the index supplies the order
+        return query.filter(lower_name.like(_escape_like(prefix) + '%', escape='\\')) \
+            .order_by(literal_column(f'lower({model.__tablename__}.name) USING ~<~'), model.id)
+    return query.filter(lower_name >= prefix, lower_name < prefix + '\U0010ffff') \
+        .order_by(lower_name, model.id)
+
+
+def prefix_search(session, model, prefix, limit=TYPEAHEAD_LIMIT):
+    # [{'id', 'name'}] for names starting with `prefix`, case-insensitively
+    return [{'id': row.id, 'name': row.name} for row in prefix_query(session, model, prefix).limit(limit)]
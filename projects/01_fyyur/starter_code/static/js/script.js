@@ -2,3 +2,31 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// Typeahead pickers: an input with data-typeahead="<url>" gets a datalist of
+// {id, name} matches for what has been typed so far; choosing one fills in
+// the id.
+document.querySelectorAll('input[data-typeahead]').forEach(function (input) {
+  var list = document.createElement('datalist');
+  var timer = null;
+  list.id = input.id + '-options';
+  input.setAttribute('list', list.id);
+  input.parentNode.appendChild(list);
+  input.addEventListener('input', function () {
+    clearTimeout(timer);
+    if (!input.value || /^\d+$/.test(input.value)) return;
+    timer = setTimeout(function () {
+      fetch(input.dataset.typeahead + '?q=' + encodeURIComponent(input.value))
+        .then(function (response) { return response.json(); })
+        .then(function (body) {
+          list.innerHTML = '';
+          body.data.forEach(function (item) {
+            var option = document.createElement('option');
+            option.value = item.id;
+            option.label = item.name;
+            list.appendChild(option);
+          });
+        });
+    }, 150);
+  });
+});
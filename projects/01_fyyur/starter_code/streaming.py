@@ -0,0 +1,75 @@
+"""Streamed JSON responses for the /api/v1 listings.
+
+Collections are written as they are read: the query runs with yield_per
+(a server-side cursor on postgres), each item is serialized on its own and
+the pieces are flushed in CHUNK_BYTES chunks, so memory stays bounded and the
+first byte goes out before the last row is fetched. Clients get one JSON
+array by default, or NDJSON (one object per line) with ?format=ndjson or
+`Accept: application/x-ndjson`.
+
+A streamed body cannot be cached or measured up front, so these responses
+skip the page cache and their Server-Timing header only covers the work done
+before the first chunk.
+"""
+import datetime as dt
+import json
+
+from flask import Response, request, stream_with_context
+
+YIELD_PER = 1000
+CHUNK_BYTES = 64 * 1024
+NDJSON = 'application/x-ndjson'
+
+
+def _default(value):
+    if isinstance(value, (dt.datetime, dt.date)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def to_json(value):
+    return json.dumps(value, default=_default, separators=(',', ':'))
+
+
+def json_response(value, status=200):
+    return Response(to_json(value), status=status, mimetype='application/json')
+
+
+def _json_array(items):
+    yield '['
+    for i, item in enumerate(items):
+        yield ',' + to_json(item) if i else to_json(item)
+    yield ']\n'
+
+
+def _ndjson(items):
+    for item in items:
+        yield to_json(item) + '\n'
+
+
+def _chunks(pieces):
+    # many small writes are far slower than a few large ones
+    buffer, size = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= CHUNK_BYTES:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def wants_ndjson():
+    if request.args.get('format') == 'ndjson':
+        return True
+    return request.accept_mimetypes.best_match(['application/json', NDJSON]) == NDJSON
+
+
+def stream_json(items):
+    # `items` is consumed lazily while the response is written
+    if wants_ndjson():
+        pieces, mimetype = _ndjson(items), NDJSON
+    else:
+        pieces, mimetype = _json_array(items), 'application/json'
+    return Response(stream_with_context(_chunks(pieces)), mimetype=mimetype)
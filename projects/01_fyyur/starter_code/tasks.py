@@ -0,0 +1,256 @@
+"""Background tasks for slow side effects of Fyyur writes.
+
+A task is a plain function registered with @tasks.task and queued with
+tasks.enqueue(func, **kwargs) (JSON-serializable arguments only). Queuing is
+transactional: a task queued before db.session.commit() only runs if that
+commit succeeds.
+
+Two queue backends are available, chosen by TASK_BACKEND:
+
+* 'database' keeps tasks in the background_tasks table, so they survive a
+  restart and any process can run them. A claimed task is leased for
+  TASK_LEASE seconds; if its worker dies, another one picks it up when the
+  lease runs out.
+* 'memory' keeps tasks in the process that queued them.
+
+TASK_WORKERS threads per process run queued tasks; they start with the first
+task queued. With TASK_WORKERS = 0, database tasks wait for `flask run-tasks`
+in a separate process, and memory tasks run inline in the caller's transaction
+(which is what the benchmarks use). A task's own database changes are
+committed together with its removal from the queue. A failing task is retried
+with exponential backoff, starting at TASK_RETRY_DELAY seconds, up to
+TASK_MAX_ATTEMPTS times; after that it is logged and, with the database
+backend, left in the table with status 'failed'.
+"""
+import datetime as dt
+import heapq
+import itertools
+import json
+import random
+import threading
+
+from sqlalchemy import event
+
+
+class Task(object):
+    def __init__(self, name, payload, attempts=0, id=None, run_at=None):
+        self.name = name
+        self.payload = payload
+        self.attempts = attempts
+        self.id = id
+        self.run_at = run_at
+
+
+class MemoryBackend(object):
+    def __init__(self):
+        self._heap = []
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+
+    def _push(self, task):
+        with self._lock:
+            heapq.heappush(self._heap, (task.run_at or dt.datetime.now(), next(self._order), task))
+
+    def add(self, session, task):
+        pass
+
+    def committed(self, tasks):
+        for task in tasks:
+            self._push(task)
+
+    def claim(self, session):
+        with self._lock:
+            if not self._heap or self._heap[0][0] > dt.datetime.now():
+                return None
+            return heapq.heappop(self._heap)[2]
+
+    def complete(self, session, task):
+        pass
+
+    def retry(self, session, task, run_at, error):
+        task.attempts += 1
+        task.run_at = run_at
+        self._push(task)
+
+    def fail(self, session, task, error):
+        pass
+
+
+class DatabaseBackend(object):
+    def __init__(self, table, lease):
+        self.table = table
+        self.lease = lease
+
+    def add(self, session, task):
+        session.execute(self.table.insert().values(
+            name=task.name,
+            payload=json.dumps(task.payload),
+            status='pending',
+            attempts=0,
+            run_at=dt.datetime.now(),
+            created_at=dt.datetime.now()
+        ))
+
+    def committed(self, tasks):
+        pass
+
+    def claim(self, session):
+        # skip rows another worker holds locked (postgres); the conditional
+        # update below settles any race on SQLite
+        t = self.table
+        now = dt.datetime.now()
+        row = session.execute(
+            t.select().where(t.c.status.in_(['pending', 'running'])).where(t.c.run_at <= now)
+            .order_by(t.c.run_at).limit(1).with_for_update(skip_locked=True)
+        ).first()
+        if row is None:
+            session.rollback()
+            return None
+        claimed = session.execute(
+            t.update().where(t.c.id == row.id).where(t.c.run_at == row.run_at)
+            .values(status='running', run_at=now + dt.timedelta(seconds=self.lease))
+        ).rowcount
+        session.commit()
+        if not claimed:
+            return None
+        return Task(row.name, json.loads(row.payload), row.attempts, id=row.id)
+
+    def complete(self, session, task):
+        session.execute(self.table.delete().where(self.table.c.id == task.id))
+
+    def retry(self, session, task, run_at, error):
+        session.execute(self.table.update().where(self.table.c.id == task.id).values(
+            status='pending', attempts=task.attempts + 1, run_at=run_at, last_error=error
+        ))
+
+    def fail(self, session, task, error):
+        session.execute(self.table.update().where(self.table.c.id == task.id).values(
+            status='failed', attempts=task.attempts + 1, last_error=error
+        ))
+
+
+class TaskQueue(object):
+    def __init__(self, app=None, db=None):
+        self.registry = {}
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        app.config.setdefault('TASK_BACKEND', 'database')
+        app.config.setdefault('TASK_WORKERS', 2)
+        app.config.setdefault('TASK_MAX_ATTEMPTS', 5)
+        app.config.setdefault('TASK_RETRY_DELAY', 2.0)
+        app.config.setdefault('TASK_POLL_INTERVAL', 1.0)
+        app.config.setdefault('TASK_LEASE', 300)
+        self.app = app
+        self.db = db
+        self.workers = app.config['TASK_WORKERS']
+        self.max_attempts = app.config['TASK_MAX_ATTEMPTS']
+        self.retry_delay = app.config['TASK_RETRY_DELAY']
+        self.poll_interval = app.config['TASK_POLL_INTERVAL']
+        self.table = db.Table(
+            'background_tasks',
+            db.Column('id', db.Integer, primary_key=True),
+            db.Column('name', db.String(120), nullable=False),
+            db.Column('payload', db.Text, nullable=False),
+            db.Column('status', db.String(20), nullable=False),
+            db.Column('attempts', db.Integer, nullable=False, default=0),
+            db.Column('run_at', db.DateTime, nullable=False),
+            db.Column('last_error', db.Text),
+            db.Column('created_at', db.DateTime, nullable=False),
+            db.Index('ix_background_tasks_status_run_at', 'status', 'run_at'),
+        )
+        if app.config['TASK_BACKEND'] == 'memory':
+            self.backend = MemoryBackend()
+            self.inline = not self.workers
+        else:
+            self.backend = DatabaseBackend(self.table, app.config['TASK_LEASE'])
+            self.inline = False
+        # tasks only become visible to workers once the queuing transaction commits
+        event.listen(db.session, 'after_commit', self._after_commit)
+        event.listen(db.session, 'after_transaction_end', self._after_transaction_end)
+        self.wake = threading.Event()
+        self._threads = []
+        self._stopping = threading.Event()
+        self._start_lock = threading.Lock()
+        app.extensions['tasks'] = self
+
+    def task(self, func):
+        self.registry[func.__name__] = func
+        return func
+
+    def enqueue(self, func, **kwargs):
+        if self.inline:
+            return func(**kwargs)
+        task = Task(func.__name__, kwargs)
+        self.backend.add(self.db.session, task)
+        self.db.session.info.setdefault('queued_tasks', []).append(task)
+        if self.workers and not self._threads:
+            self.start()
+
+    def start(self, workers=None):
+        with self._start_lock:
+            if self._threads:
+                return
+            for i in range(workers or self.workers):
+                thread = threading.Thread(target=self.work, name=f'task-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        self._stopping.set()
+        self.wake.set()
+
+    def _after_commit(self, session):
+        queued = session.info.pop('queued_tasks', None)
+        if queued:
+            self.backend.committed(queued)
+            self.wake.set()
+
+    def _after_transaction_end(self, session, transaction):
+        # a rolled back transaction takes its queued tasks with it
+        if transaction.parent is None:
+            session.info.pop('queued_tasks', None)
+
+    def work(self):
+        # claim and run tasks until stop() is called
+        while not self._stopping.is_set():
+            with self.app.app_context():
+                ran = self.run_next()
+            if not ran:
+                self.wake.wait(self.poll_interval)
+                self.wake.clear()
+
+    def run_next(self):
+        session = self.db.session
+        try:
+            task = self.backend.claim(session)
+            if task is None:
+                return False
+            self._run(session, task)
+            return True
+        finally:
+            session.remove()
+
+    def backoff(self, attempts):
+        # exponential, with jitter so retries of one burst don't line up
+        return self.retry_delay * 2 ** (attempts - 1) * random.uniform(0.5, 1.0)
+
+    def _run(self, session, task):
+        try:
+            self.registry[task.name](**task.payload)
+            self.backend.complete(session, task)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            error = f'{type(e).__name__}: {e}'
+            attempts = task.attempts + 1
+            if attempts >= self.max_attempts:
+                self.app.logger.exception('task %s%r failed after %d attempts', task.name, task.payload, attempts)
+                self.backend.fail(session, task, error)
+            else:
+                self.app.logger.warning('task %s%r failed (attempt %d), retrying: %s',
+                                        task.name, task.payload, attempts, error)
+                run_at = dt.datetime.now() + dt.timedelta(seconds=self.backoff(attempts))
+                self.backend.retry(session, task, run_at, error)
+            session.commit()
@@ -0,0 +1,369 @@
+"""Tests for Fyyur.
+
+    python -m unittest test_app
+
+They run against DATABASE_URL, an in-memory SQLite database unless set; the
+tests of postgres-only paths (COPY imports, exclusion constraints) are
+skipped on SQLite.
+"""
+import os
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('TASK_BACKEND', 'memory')
+os.environ.setdefault('TASK_WORKERS', '0')
+
+import csv
+import datetime as dt
+import random
+import re
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from sqlalchemy.exc import IntegrityError
+
+from app import app, db, Venue, Artist, Show, EXCLUSION_VIOLATION, MAX_SHOW_MINUTES, import_rows, \
+    booking_conflicts, free_slots, page_cache, MAX_SHOWS_PER_PAGE, \
+    image_link_ok, link_opener, validate_image_link
+from importer import insert_batch
+
+POSTGRES = db.engine.dialect.name == 'postgresql'
+
+
+class FyyurTestCase(unittest.TestCase):
+    """Base case: an empty schema with two venues and two artists"""
+
+    def setUp(self):
+        self.context = app.app_context()
+        self.context.push()
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+        for i in (1, 2):
+            db.session.add(Venue(id=i, name=f'Venue {i}', city='Austin', state='TX'))
+            db.session.add(Artist(id=i, name=f'Artist {i}', city='Austin', state='TX'))
+        db.session.commit()
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        db.session.remove()
+        self.context.pop()
+        shutil.rmtree(self.tmp)
+
+    def add_show(self, venue_id, artist_id, start_time, duration=180):
+        show = Show(venue_id=venue_id, artist_id=artist_id, start_time=start_time, duration=duration)
+        db.session.add(show)
+        db.session.commit()
+        return show
+
+    def write_csv(self, name, rows):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        return path
+
+
+class ShowDurationTestCase(FyyurTestCase):
+    """Show lengths, which the overlap checks assume are capped"""
+
+    def test_duration_over_the_cap_is_refused(self):
+        with self.assertRaises(IntegrityError):
+            self.add_show(1, 1, dt.datetime(2030, 1, 1, 20), duration=MAX_SHOW_MINUTES + 1)
+        db.session.rollback()
+
+    def test_duration_at_the_cap_is_accepted(self):
+        self.add_show(1, 1, dt.datetime(2030, 1, 1, 20), duration=MAX_SHOW_MINUTES)
+
+        self.assertEqual(Show.query.count(), 1)
+
+
+DAY = dt.datetime(2030, 1, 1)
+
+
+def at(hours, days=0):
+    return DAY + dt.timedelta(days=days, hours=hours)
+
+
+class BookingConflictsTestCase(FyyurTestCase):
+    """booking_conflicts: shows of a venue or an artist overlapping a new one"""
+
+    def setUp(self):
+        super().setUp()
+        # venue 1 and artist 1, 20:00 to 23:00
+        self.add_show(1, 1, at(20))
+
+    def conflicts(self, venue_id, artist_id, start_time, duration):
+        return [show.start_time for show in booking_conflicts(venue_id, artist_id, start_time, duration)]
+
+    def test_same_venue_overlap(self):
+        self.assertEqual(self.conflicts(1, 2, at(22), 60), [at(20)])
+
+    def test_same_artist_overlap(self):
+        self.assertEqual(self.conflicts(2, 1, at(19), 90), [at(20)])
+
+    def test_containing_show(self):
+        self.assertEqual(self.conflicts(1, 2, at(19), 300), [at(20)])
+
+    def test_back_to_back_shows_do_not_overlap(self):
+        self.assertEqual(self.conflicts(1, 1, at(17), 180), [])
+        self.assertEqual(self.conflicts(1, 1, at(23), 60), [])
+
+    def test_other_venue_and_artist(self):
+        self.assertEqual(self.conflicts(2, 2, at(20), 180), [])
+
+    def test_longest_show_is_found(self):
+        self.add_show(2, 2, at(6), duration=MAX_SHOW_MINUTES)
+
+        self.assertEqual(self.conflicts(2, 1, at(17), 30), [at(6)])
+
+    def test_show_crossing_midnight(self):
+        self.add_show(2, 2, at(23), duration=180)
+
+        self.assertEqual(self.conflicts(2, 1, at(1, days=1), 60), [at(23)])
+        self.assertEqual(self.conflicts(2, 1, at(2, days=1), 60), [])
+
+    def test_matches_brute_force(self):
+        rng = random.Random(0)
+        for _ in range(300):
+            # overlapping freely: SQLite has no exclusion constraints
+            db.session.add(Show(venue_id=rng.randint(1, 2), artist_id=rng.randint(1, 2),
+                                start_time=at(rng.uniform(0, 96)), duration=rng.randint(1, MAX_SHOW_MINUTES)))
+        db.session.commit()
+        shows = Show.query.all()
+
+        for _ in range(200):
+            venue_id, artist_id = rng.randint(1, 2), rng.randint(1, 2)
+            start_time, duration = at(rng.uniform(-12, 108)), rng.randint(1, MAX_SHOW_MINUTES)
+            end_time = start_time + dt.timedelta(minutes=duration)
+            expected = sorted(show.id for show in shows
+                              if (show.venue_id == venue_id or show.artist_id == artist_id)
+                              and show.start_time < end_time and start_time < show.end_time)
+            found = sorted(show.id for show in booking_conflicts(venue_id, artist_id, start_time, duration))
+            self.assertEqual(found, expected)
+
+
+class FreeSlotsTestCase(FyyurTestCase):
+    """free_slots: gaps between a venue's shows within its opening hours"""
+
+    def slots(self, start, end, **kwargs):
+        return [(slot['start'], slot['end']) for slot in free_slots(1, start, end, **kwargs)]
+
+    def test_no_shows(self):
+        self.assertEqual(self.slots(at(0), at(0, days=2), opens=18, closes=23),
+                         [(at(18), at(23)), (at(18, days=1), at(23, days=1))])
+
+    def test_gaps_around_shows(self):
+        self.add_show(1, 1, at(19), duration=60)
+        self.add_show(1, 2, at(21), duration=30)
+
+        self.assertEqual(self.slots(at(0), at(24), opens=18, closes=23),
+                         [(at(18), at(19)), (at(20), at(21)), (at(21.5), at(23))])
+
+    def test_minimum_length(self):
+        self.add_show(1, 1, at(19), duration=60)
+        self.add_show(1, 2, at(21), duration=30)
+
+        self.assertEqual(self.slots(at(0), at(24), min_minutes=61, opens=18, closes=23),
+                         [(at(21.5), at(23))])
+
+    def test_shows_of_other_venues_are_ignored(self):
+        self.add_show(2, 1, at(19))
+
+        self.assertEqual(self.slots(at(0), at(24), opens=18, closes=23), [(at(18), at(23))])
+
+    def test_show_outside_opening_hours(self):
+        self.add_show(1, 1, at(12))
+
+        self.assertEqual(self.slots(at(0), at(24), opens=18, closes=23), [(at(18), at(23))])
+
+    def test_range_clips_opening_hours(self):
+        self.assertEqual(self.slots(at(20), at(22), opens=18, closes=23), [(at(20), at(22))])
+
+    def test_opening_hours_past_midnight(self):
+        self.add_show(1, 1, at(23), duration=120)
+
+        # the first window is the tail of the night before the range
+        self.assertEqual(self.slots(at(0), at(0, days=2), opens=18, closes=26), [
+            (at(0), at(2)),
+            (at(18), at(23)),
+            (at(1, days=1), at(2, days=1)),
+            (at(18, days=1), at(0, days=2)),
+        ])
+
+    def test_show_crossing_into_the_range(self):
+        # started the day before the range, so only found by looking back
+        self.add_show(1, 1, at(23), duration=180)
+
+        self.assertEqual(self.slots(at(0, days=1), at(6, days=1)), [(at(2, days=1), at(6, days=1))])
+
+
+class ImportBookingTestCase(FyyurTestCase):
+    """import-data's booking checks on shows"""
+
+    def import_shows(self, rows, chunk_size=5000):
+        imported, rejected, _ = import_rows('shows', self.write_csv('shows.csv', rows), {}, chunk_size)
+        return imported, [line for line, _ in rejected]
+
+    def row(self, venue_id, artist_id, start_time, duration=120):
+        return {'venue_id': venue_id, 'artist_id': artist_id,
+                'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S'), 'duration': duration}
+
+    def test_duplicates_in_one_chunk(self):
+        imported, rejected = self.import_shows([
+            self.row(1, 1, at(20)),
+            self.row(1, 1, at(20)),
+            self.row(2, 1, at(21)),
+            self.row(1, 2, at(21)),
+        ])
+
+        self.assertEqual(imported, 1)
+        self.assertEqual(rejected, [3, 4, 5])
+        self.assertEqual(Show.query.count(), 1)
+
+    def test_back_to_back_in_one_chunk(self):
+        imported, rejected = self.import_shows([
+            self.row(1, 1, at(18)),
+            self.row(1, 1, at(20)),
+            self.row(1, 1, at(22)),
+        ])
+
+        self.assertEqual((imported, rejected), (3, []))
+
+    def test_overlap_with_existing_show(self):
+        self.add_show(1, 1, at(20))
+
+        imported, rejected = self.import_shows([
+            self.row(1, 2, at(22)),
+            self.row(2, 1, at(19)),
+            self.row(2, 2, at(22)),
+            self.row(1, 1, at(23)),
+        ])
+
+        self.assertEqual((imported, rejected), (2, [2, 3]))
+
+    def test_overlap_across_chunks(self):
+        imported, rejected = self.import_shows([
+            self.row(1, 1, at(20)),
+            self.row(1, 2, at(21)),
+            self.row(2, 2, at(21)),
+        ], chunk_size=1)
+
+        self.assertEqual((imported, rejected), (2, [3]))
+
+    def test_show_crossing_midnight(self):
+        self.add_show(1, 1, at(23), duration=180)
+
+        imported, rejected = self.import_shows([
+            self.row(1, 2, at(1, days=1)),
+            self.row(1, 2, at(2, days=1)),
+        ])
+
+        self.assertEqual((imported, rejected), (1, [2]))
+
+
+class ShowsPageTestCase(FyyurTestCase):
+    """/shows, a keyset page at a time"""
+
+    def setUp(self):
+        super().setUp()
+        for hour in range(4):
+            self.add_show(1, 1, at(hour * 4))
+        # pages cached by earlier tests showed a different database
+        page_cache.invalidate('shows')
+
+    def pager_sizes(self, query):
+        # the per_page values in the pager links
+        response = app.test_client().get('/shows' + query)
+        self.assertEqual(response.status_code, 200)
+        return set(re.findall(r'per_page=(-?\d+)', response.get_data(as_text=True)))
+
+    def test_per_page_floor(self):
+        self.assertEqual(self.pager_sizes('?per_page=-5'), {'1'})
+        self.assertEqual(self.pager_sizes('?per_page=0'), {'1'})
+
+    def test_per_page_cap(self):
+        self.assertEqual(self.pager_sizes(f'?per_page=100000&after={at(2).isoformat()}_1'), {str(MAX_SHOWS_PER_PAGE)})
+
+
+class ImageLinkTestCase(FyyurTestCase):
+    """Image link checks, which must only ever request public http(s) URLs"""
+
+    def assertNotRequested(self, url):
+        with mock.patch.object(link_opener, 'open') as opened:
+            self.assertFalse(image_link_ok(url))
+        opened.assert_not_called()
+
+    def test_link_without_scheme(self):
+        self.assertNotRequested('images.example.com/venue.jpg')
+
+    def test_javascript_link(self):
+        self.assertNotRequested('javascript:alert(1)')
+
+    def test_file_link(self):
+        self.assertNotRequested('file:///etc/passwd')
+
+    def test_internal_hosts(self):
+        self.assertNotRequested('http://127.0.0.1/venue.jpg')
+        self.assertNotRequested('http://10.0.0.1:8080/venue.jpg')
+        self.assertNotRequested('http://[::1]/venue.jpg')
+
+    def test_bad_link_is_cleared(self):
+        venue = Venue.query.get(1)
+        venue.image_link = 'file:///etc/passwd'
+        db.session.commit()
+
+        validate_image_link(kind='venue', id=1, url='file:///etc/passwd')
+        db.session.commit()
+
+        self.assertIsNone(Venue.query.get(1).image_link)
+
+
+@unittest.skipUnless(POSTGRES, 'COPY and exclusion constraints are postgres only')
+class CopyImportTestCase(FyyurTestCase):
+    """Chunks written with COPY that violate a booking constraint"""
+
+    def setUp(self):
+        super().setUp()
+        # the constraints of migration f3c9d1e5a7b2, which create_all leaves out
+        booked = "tsrange(start_time, start_time + duration * interval '1 minute')"
+        db.session.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+        db.session.execute('ALTER TABLE shows ADD CONSTRAINT ex_shows_venue_booking '
+                           f'EXCLUDE USING gist (venue_id WITH =, {booked} WITH &&)')
+        db.session.execute('ALTER TABLE shows ADD CONSTRAINT ex_shows_artist_booking '
+                           f'EXCLUDE USING gist (artist_id WITH =, {booked} WITH &&)')
+        db.session.commit()
+
+    def test_copy_raises_integrity_error(self):
+        self.add_show(1, 1, dt.datetime(2030, 1, 1, 20))
+
+        with self.assertRaises(IntegrityError) as raised:
+            insert_batch(db.session, Show.__table__, [
+                {'id': 100, 'venue_id': 1, 'artist_id': 2, 'start_time': dt.datetime(2030, 1, 1, 21), 'duration': 60}
+            ])
+        db.session.rollback()
+
+        self.assertEqual(raised.exception.orig.pgcode, EXCLUSION_VIOLATION)
+
+    def test_import_rejects_rows_the_copy_refuses(self):
+        path = self.write_csv('shows.csv', [
+            {'venue_id': 1, 'artist_id': 1, 'start_time': '2030-01-01 20:00:00', 'duration': 120},
+            {'venue_id': 2, 'artist_id': 2, 'start_time': '2030-01-01 20:00:00', 'duration': 120},
+            {'venue_id': 1, 'artist_id': 2, 'start_time': '2030-01-01 21:00:00', 'duration': 120},
+        ])
+
+        # let the overlap through the import's own check, as a show booked by
+        # another process after the check would be
+        with mock.patch('app.import_conflict', return_value=None):
+            imported, rejected, _ = import_rows('shows', path, {})
+
+        self.assertEqual(imported, 2)
+        self.assertEqual([line for line, _ in rejected], [4])
+        self.assertEqual(Show.query.count(), 2)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
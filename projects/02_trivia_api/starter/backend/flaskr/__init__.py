@@ -3,28 +3,71 @@ import json
 from flask import Flask, request, abort, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-import random
+import time
 
-from models import setup_db, Question, Category
+from models import setup_db, Question
+from .catalog import categories
+from .search import search_questions as find_questions
+from .quiz import pick_question, invalidate_question_ids, make_session_store, start_session, deal_question
 
 QUESTIONS_PER_PAGE = 10
+COUNT_TTL = 30
 
+# {category id or None: (expires at, question count)}
+_question_counts = {}
 
-def paginate_questions(request, selection):
+
+def paginate_questions(request, query):
+    # only the requested page is fetched (LIMIT/OFFSET) and formatted;
+    # ?cursor=<last id seen> reads the page after that id off the primary
+    # key instead, which stays fast however deep the client pages
     page = request.args.get('page', 1, int)
-    start = (page - 1) * QUESTIONS_PER_PAGE
-    end = start + QUESTIONS_PER_PAGE
+    cursor = request.args.get('cursor', None, int)
+    if page < 1:
+        abort(400)
+
+    query = query.order_by(Question.id)
+    if cursor is not None:
+        query = query.filter(Question.id > cursor)
+    else:
+        query = query.offset((page - 1) * QUESTIONS_PER_PAGE)
+    query = query.limit(QUESTIONS_PER_PAGE)
+
+    return [question.format() for question in query]
+
 
-    formatted_questions = [question.format() for question in selection]
-    page_questions = formatted_questions[start:end]
+def next_cursor(page_questions):
+    if len(page_questions) < QUESTIONS_PER_PAGE:
+        return None
+    return page_questions[-1]['id']
 
-    return page_questions
+
+def count_questions(category_id=None):
+    # counts are cached per process for COUNT_TTL seconds and dropped on
+    # writes made through this process
+    cached = _question_counts.get(category_id)
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+    query = Question.query
+    if category_id is not None:
+        query = query.filter(Question.category == category_id)
+    count = query.count()
+    _question_counts[category_id] = (time.monotonic() + COUNT_TTL, count)
+    return count
+
+
+def invalidate_question_caches():
+    _question_counts.clear()
+    invalidate_question_ids()
 
 
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
+    if test_config is not None:
+        app.config.from_mapping(test_config)
     setup_db(app)
+    quiz_sessions = make_session_store(app.config)
 
     '''
     Set up CORS. Allow '*' for origins. Delete the sample route after completing the TODOs
@@ -47,13 +90,13 @@ def create_app(test_config=None):
 
     @app.route('/categories', methods=['GET'])
     def get_categories():
-        categories = Category.query.order_by(Category.id).all()
-        formatted_categories = [category.type for category in categories]
-        # category_dict = {category.id: category.type for category in categories}
-        return jsonify({
+        catalog = categories.current()
+        response = jsonify({
             'success': True,
-            'categories': formatted_categories
+            'categories': catalog.types
         })
+        response.set_etag(f'categories-{catalog.version}')
+        return response.make_conditional(request)
 
     '''
     Endpoint to handle GET requests for questions,
@@ -69,24 +112,25 @@ def create_app(test_config=None):
 
     @app.route('/questions', methods=['GET'])
     def get_questions():
-        questions = Question.query.order_by(Question.id).all()
-        formatted_questions = paginate_questions(request, questions)
+        formatted_questions = paginate_questions(request, Question.query)
         if len(formatted_questions) == 0:
             abort(404)
+        cursor = next_cursor(formatted_questions)
 
         # fix off-by-one error
         for question in formatted_questions:
             question['category'] -= 1
 
-        categories = Category.query.order_by(Category.id).all()
-        category_list = [category.type for category in categories]
-        return jsonify({
+        response = jsonify({
             'success': True,
             'questions': formatted_questions,
-            'total_questions': len(questions),
-            'categories': category_list,
+            'total_questions': count_questions(),
+            'next_cursor': cursor,
+            'categories': categories.current().types,
             'current_category': ''
         })
+        response.add_etag()
+        return response.make_conditional(request)
 
     '''
     Endpoint to DELETE question using a question ID.
@@ -101,6 +145,7 @@ def create_app(test_config=None):
         if question is None:
             abort(404)
         question.delete()
+        invalidate_question_caches()
         return jsonify({
             'success': True,
             'question_id': question_id
@@ -141,6 +186,7 @@ def create_app(test_config=None):
             question.insert()
         except:
             abort(500)
+        invalidate_question_caches()
 
         return jsonify({
             'success': True
@@ -148,8 +194,10 @@ def create_app(test_config=None):
 
     '''
     POST endpoint to get questions based on a search term.
-    It should return any questions for whom the search term
-    is a substring of the question.
+    It returns one page (?page=N or 'page' in the body) of the questions
+    whose question or answer text matches the term, best match first.
+    With 'prefix': true every word of the term matches as a word prefix,
+    for searching as the user types.
 
     TEST: Search by any phrase. The questions list will update to include
     only question that include that string within their question.
@@ -162,20 +210,22 @@ def create_app(test_config=None):
     @app.route('/questions_search', methods=['POST'])
     def search_questions():
         try:
-            search_term = request.get_json()['searchTerm']
+            all_data = request.get_json()
+            search_term = all_data['searchTerm']
+            page = int(all_data.get('page', request.args.get('page', 1)))
+            prefix = bool(all_data.get('prefix', False))
         except:
             abort(400)
 
-        if search_term is None:
+        if search_term is None or page < 1:
             abort(400)
 
-        questions = Question.query.filter(Question.question.ilike(f'%{search_term}%')).all()
-        formatted_questions = [question.format() for question in questions]
+        formatted_questions, total_questions = find_questions(search_term, page, prefix)
 
         return jsonify({
             'success': True,
             'questions': formatted_questions,
-            'total_questions': len(questions),
+            'total_questions': total_questions,
             'current_category': ''
         })
 
@@ -191,21 +241,18 @@ def create_app(test_config=None):
     def get_questions_by_category(category_id):
         # fix off-by-one error
         category_id += 1
-        try:
-            questions = Question.query.filter(Question.category == category_id).all()
-            category = Category.query.get(category_id)
-            if questions is None or category is None:
-                abort(404)
-        except:
+        category_type = categories.current().type_by_id.get(category_id)
+        if category_type is None:
             abort(404)
 
-        formatted_questions = [question.format() for question in questions]
+        formatted_questions = paginate_questions(request, Question.query.filter(Question.category == category_id))
 
         return jsonify({
             'success': True,
             'questions': formatted_questions,
-            'total_questions': len(questions),
-            'current_category': category.type
+            'total_questions': count_questions(category_id),
+            'next_cursor': next_cursor(formatted_questions),
+            'current_category': category_type
         })
 
     '''
@@ -230,33 +277,57 @@ def create_app(test_config=None):
 
             # fix off-by-one error
             category_id += 1
+
+            # accept ids or formatted questions
+            seen = {
+                int(question['id'] if isinstance(question, dict) else question)
+                for question in previous_questions
+            }
         except:
             abort(400)
 
-        if quiz_category is None:
-            abort(400)
+        next_question = pick_question(category_id, seen)
+
+        return jsonify({
+            'success': True,
+            'question': next_question.format() if next_question is not None else None
+        })
+
+    '''
+    POST endpoint to start a quiz session: the server shuffles
+    the category's questions into a deck and deals them one at a time
+    from POST /quizzes/<session_id>/next, so the client
+    doesn't have to send back the questions it has already seen.
+    '''
+
+    @app.route('/quizzes/sessions', methods=['POST'])
+    def start_quiz_session():
+        try:
+            category_id = int(request.get_json()['quiz_category']['id'])
 
-        all_category_questions = Question.query.filter(Question.category == category_id).all()
+            # fix off-by-one error
+            category_id += 1
+        except:
+            abort(400)
 
-        if len(previous_questions) == len(all_category_questions):
-            return jsonify({
-                'success': True,
-                'question': None
-            })
+        session_id, total_questions = start_session(quiz_sessions, category_id)
 
-        if len(previous_questions) > 0:
-            remaining_questions = [question for question in all_category_questions if question.id not in previous_questions]
-        else:
-            remaining_questions = all_category_questions
+        return jsonify({
+            'success': True,
+            'session_id': session_id,
+            'total_questions': total_questions
+        })
 
-        if len(remaining_questions) == 0:
+    @app.route('/quizzes/<session_id>/next', methods=['POST'])
+    def next_quiz_question(session_id):
+        try:
+            next_question = deal_question(quiz_sessions, session_id)
+        except KeyError:
             abort(404)
 
-        next_question = random.choice(remaining_questions)
-
         return jsonify({
             'success': True,
-            'question': next_question.format()
+            'question': next_question.format() if next_question is not None else None
         })
 
     '''
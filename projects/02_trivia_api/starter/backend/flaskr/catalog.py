@@ -0,0 +1,79 @@
+"""The category catalog, cached in each process.
+
+Categories are read on most requests and almost never change, so each
+process keeps them in memory along with the version stamp stored in the
+cache_versions table. Every ORM write to a category replaces the stamp in
+the same transaction. A process compares its stamp with the stored one at
+most once every CHECK_INTERVAL seconds (and straight after it commits a
+category change itself) and reloads the catalog when they differ, so all
+workers agree within CHECK_INTERVAL of a change. Categories changed with
+plain SQL need the stamp replaced by hand, or stay stale until a restart.
+
+The stamp doubles as the ETag of the category listing.
+"""
+import collections
+import time
+import uuid
+
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+
+from models import db, Category, CacheVersion
+
+CHECK_INTERVAL = 1.0
+VERSION_NAME = 'categories'
+
+Catalog = collections.namedtuple('Catalog', ['version', 'types', 'type_by_id'])
+
+
+def read_version():
+    row = db.session.query(CacheVersion.version).filter(CacheVersion.name == VERSION_NAME).first()
+    return row.version if row is not None else ''
+
+
+def bump_version(connection):
+    version = uuid.uuid4().hex
+    table = CacheVersion.__table__
+    updated = connection.execute(
+        table.update().where(table.c.name == VERSION_NAME).values(version=version)
+    ).rowcount
+    if not updated:
+        connection.execute(table.insert().values(name=VERSION_NAME, version=version))
+
+
+class CategoryCatalog(object):
+    def __init__(self, check_interval=CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._catalog = None
+        self._checked_at = 0.0
+        for name in ('after_insert', 'after_update', 'after_delete'):
+            event.listen(Category, name, self._category_changed)
+        event.listen(db.session, 'after_commit', self._after_commit)
+
+    def current(self):
+        now = time.monotonic()
+        if self._catalog is None or now - self._checked_at >= self.check_interval:
+            version = read_version()
+            if self._catalog is None or version != self._catalog.version:
+                self._catalog = self.load(version)
+            self._checked_at = now
+        return self._catalog
+
+    def load(self, version):
+        categories = Category.query.order_by(Category.id).all()
+        return Catalog(
+            version,
+            [category.type for category in categories],
+            {category.id: category.type for category in categories}
+        )
+
+    def _category_changed(self, mapper, connection, target):
+        bump_version(connection)
+        object_session(target).info['categories_changed'] = True
+
+    def _after_commit(self, session):
+        if session.info.pop('categories_changed', False):
+            self._checked_at = 0.0
+
+
+categories = CategoryCatalog()
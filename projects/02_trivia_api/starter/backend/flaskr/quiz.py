@@ -0,0 +1,192 @@
+"""Random quiz questions without loading the whole category.
+
+Each category's question ids are read once (only the ids, ordered off the
+primary key) and cached per process for IDS_TTL seconds; writes made through
+this process drop the cache. A question is picked by drawing random positions
+in that array until one lands on an id the player hasn't seen, then fetching
+that one row by primary key. A pick therefore costs a few set lookups and a
+single-row query whatever the size of the category or the length of the
+session; only once nearly all of a category has been seen do the draws give
+way to one pass over the unseen ids.
+
+Quiz sessions spare the client from sending every question it has seen:
+starting one shuffles the category's ids into a deck held by the server,
+and each call to next() deals the top card. Decks live in a session store,
+picked by QUIZ_SESSION_STORE:
+
+* 'memory' keeps up to QUIZ_SESSION_MAX decks in this process, least
+  recently used first out; a deck left alone for QUIZ_SESSION_TTL seconds
+  expires. Sessions are lost on restart and are only visible to the process
+  that created them, so it suits a single worker.
+* 'database' keeps decks in the quiz_sessions/quiz_session_questions
+  tables, one row per card, so any worker can deal from any session.
+
+Dealing is O(1) in both: a list pop, or a conditional position bump plus a
+primary key lookup.
+"""
+import datetime as dt
+import random
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from models import db, Question, QuizSession, QuizSessionQuestion
+
+IDS_TTL = 60
+MAX_DRAWS = 8
+
+# {category id: (expires at, [question ids])}
+_question_ids = {}
+
+
+def question_ids(category_id):
+    cached = _question_ids.get(category_id)
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+    rows = Question.query.with_entities(Question.id) \
+        .filter(Question.category == category_id).order_by(Question.id).all()
+    ids = [row.id for row in rows]
+    _question_ids[category_id] = (time.monotonic() + IDS_TTL, ids)
+    return ids
+
+
+def invalidate_question_ids():
+    _question_ids.clear()
+
+
+def random_unseen_id(ids, seen):
+    # `seen` is a set; None when every id has been seen
+    for _ in range(MAX_DRAWS):
+        if not ids:
+            break
+        question_id = random.choice(ids)
+        if question_id not in seen:
+            return question_id
+    remaining = [question_id for question_id in ids if question_id not in seen]
+    return random.choice(remaining) if remaining else None
+
+
+def pick_question(category_id, seen):
+    while True:
+        question_id = random_unseen_id(question_ids(category_id), seen)
+        if question_id is None:
+            return None
+        question = Question.query.get(question_id)
+        if question is not None:
+            return question
+        # deleted by another process since the ids were cached
+        invalidate_question_ids()
+
+
+class MemorySessionStore(object):
+    def __init__(self, max_sessions, ttl):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        # {session id: (expires at, deck)}, least recently used first; the
+        # top of a deck is its last item
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        # entries are in order of last use, so expired ones are at the front
+        while self._sessions:
+            session_id, (expires_at, deck) = next(iter(self._sessions.items()))
+            if expires_at > now and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[session_id]
+
+    def create(self, deck):
+        session_id = secrets.token_hex(16)
+        with self._lock:
+            self._sessions[session_id] = (time.monotonic() + self.ttl, deck[::-1])
+            self._expire(time.monotonic())
+        return session_id
+
+    def next(self, session_id):
+        # the next question id, None once the deck is empty, or KeyError
+        # for an unknown or expired session
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            expires_at, deck = self._sessions.pop(session_id)
+            self._sessions[session_id] = (now + self.ttl, deck)
+            return deck.pop() if deck else None
+
+
+class DatabaseSessionStore(object):
+    def __init__(self, ttl):
+        self.ttl = ttl
+
+    def _expire(self):
+        now = dt.datetime.utcnow()
+        expired = db.session.query(QuizSession.id).filter(QuizSession.expires_at <= now)
+        QuizSessionQuestion.query.filter(QuizSessionQuestion.session_id.in_(expired.subquery())) \
+            .delete(synchronize_session=False)
+        expired.delete(synchronize_session=False)
+
+    def create(self, deck):
+        session_id = secrets.token_hex(16)
+        self._expire()
+        db.session.add(QuizSession(
+            id=session_id,
+            position=0,
+            size=len(deck),
+            expires_at=dt.datetime.utcnow() + dt.timedelta(seconds=self.ttl)
+        ))
+        db.session.flush()
+        db.session.bulk_insert_mappings(QuizSessionQuestion, [
+            {'session_id': session_id, 'position': position, 'question_id': question_id}
+            for position, question_id in enumerate(deck)
+        ])
+        db.session.commit()
+        return session_id
+
+    def next(self, session_id):
+        while True:
+            now = dt.datetime.utcnow()
+            session = db.session.query(QuizSession.position, QuizSession.size) \
+                .filter(QuizSession.id == session_id, QuizSession.expires_at > now).first()
+            if session is None:
+                db.session.rollback()
+                raise KeyError(session_id)
+            if session.position >= session.size:
+                db.session.rollback()
+                return None
+            # only one concurrent caller moves the position on; the others retry
+            dealt = QuizSession.query \
+                .filter(QuizSession.id == session_id, QuizSession.position == session.position) \
+                .update({
+                    'position': session.position + 1,
+                    'expires_at': now + dt.timedelta(seconds=self.ttl)
+                }, synchronize_session=False)
+            db.session.commit()
+            if dealt:
+                return db.session.query(QuizSessionQuestion.question_id).filter(
+                    QuizSessionQuestion.session_id == session_id,
+                    QuizSessionQuestion.position == session.position
+                ).scalar()
+
+
+def make_session_store(config):
+    ttl = config.get('QUIZ_SESSION_TTL', 3600)
+    if config.get('QUIZ_SESSION_STORE', 'memory') == 'database':
+        return DatabaseSessionStore(ttl)
+    return MemorySessionStore(config.get('QUIZ_SESSION_MAX', 10000), ttl)
+
+
+def start_session(store, category_id):
+    deck = list(question_ids(category_id))
+    random.shuffle(deck)
+    return store.create(deck), len(deck)
+
+
+def deal_question(store, session_id):
+    # the next question still in the bank, or None when the deck runs out
+    while True:
+        question_id = store.next(session_id)
+        if question_id is None:
+            return None
+        question = Question.query.get(question_id)
+        if question is not None:
+            return question
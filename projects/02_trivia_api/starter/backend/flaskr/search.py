@@ -0,0 +1,122 @@
+"""Ranked question search over the question and answer text.
+
+A question matches when its english text search document matches the term
+or its question or answer text contains the term as a substring. On postgres
+the document is served by the GIN index ix_questions_search and, when pg_trgm
+is installed, substrings by the trigram index; hits are ranked by ts_rank and
+then trigram similarity. On SQLite the porter-stemmed questions_fts FTS5
+table is searched, along with the trigram-tokenized questions_trgm table for
+substrings (LIKE for terms under three characters, or when this SQLite has no
+trigram tokenizer), and stemmed hits come first, by bm25. The indexes are
+created by models.create_search_index.
+
+Prefix mode, for search-as-you-type, matches every word of the term as a
+word prefix off the text search indexes. Results come a page at a time, with
+the total number of hits counted in the same query; a page past the last hit
+counts them separately.
+"""
+import re
+
+from sqlalchemy import bindparam, func, literal_column, select, table, column, text, union
+
+from models import db, Question, QUESTION_SEARCH_TEXT, QUESTION_SEARCH_DOCUMENT
+
+SEARCH_PAGE_SIZE = 10
+
+_trgm = {}
+
+
+def search_words(term):
+    return re.findall(r'\w+', term)
+
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def has_trgm(session):
+    # whether substring matches have a trigram index: pg_trgm on postgres, the
+    # questions_trgm table on SQLite
+    bind = session.get_bind()
+    if bind.url not in _trgm:
+        if bind.dialect.name == 'postgresql':
+            check = "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+        else:
+            check = "SELECT 1 FROM sqlite_master WHERE name = 'questions_trgm'"
+        _trgm[bind.url] = session.execute(text(check)).first() is not None
+    return _trgm[bind.url]
+
+
+def _contains(term):
+    # ILIKE '%term%' over the question and answer text
+    pattern = '%' + _escape_like(term) + '%'
+    return Question.question.ilike(pattern, escape='\\') | Question.answer.ilike(pattern, escape='\\')
+
+
+def _postgres_search(query, term, words, prefix):
+    document = literal_column(QUESTION_SEARCH_DOCUMENT)
+    search_text = literal_column(f'({QUESTION_SEARCH_TEXT})')
+    if prefix:
+        tsquery = func.to_tsquery('english', ' & '.join(word + ':*' for word in words))
+    else:
+        tsquery = func.plainto_tsquery('english', term)
+    match = document.op('@@')(tsquery)
+    ranking = [func.ts_rank(document, tsquery).desc()]
+    if prefix:
+        return query.filter(match).order_by(*ranking, Question.id)
+    # a named parameter, as the default one would be named after the expression
+    substring = search_text.ilike(bindparam('substring', '%' + _escape_like(term) + '%'), escape='\\')
+    # without pg_trgm the substring match reads every row
+    if has_trgm(db.session):
+        ranking.append(func.similarity(search_text, term).desc())
+    return query.filter(match | substring).order_by(*ranking, Question.id)
+
+
+def _fts_hits(name, phrases):
+    # (rowid, rank) of the rows of FTS5 table `name` matching `phrases`
+    fts = table(name, column('rowid'), column('rank'))
+    return select([fts.c.rowid, fts.c.rank]).where(literal_column(name).op('MATCH')(phrases))
+
+
+def _sqlite_search(query, term, words, prefix):
+    # quoted, so words are never read as FTS5 operators
+    phrases = ['"' + word + '"' + ('*' if prefix else '') for word in words]
+    stemmed = _fts_hits('questions_fts', ' '.join(phrases)).alias('stemmed')
+    if prefix:
+        return query.join(stemmed, stemmed.c.rowid == Question.id).order_by(stemmed.c.rank, Question.id)
+
+    if len(term) >= 3 and has_trgm(db.session):
+        substrings = _fts_hits('questions_trgm', '"' + term.replace('"', '""') + '"')
+        ids = union(select([stemmed.c.rowid]), select([substrings.c.rowid]))
+        match = Question.id.in_(ids)
+    else:
+        match = Question.id.in_(select([stemmed.c.rowid])) | _contains(term)
+    # substring-only hits have no stemmed rank and come last
+    return query.outerjoin(stemmed, stemmed.c.rowid == Question.id).filter(match) \
+        .order_by(stemmed.c.rank.is_(None), stemmed.c.rank, Question.id)
+
+
+def search_questions(term, page=1, prefix=False, page_size=SEARCH_PAGE_SIZE):
+    # (formatted questions on `page`, total number of hits), best hit first
+    term = term.strip()
+    words = search_words(term)
+    matches = db.session.query(Question)
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql' and words:
+        matches = _postgres_search(matches, term, words, prefix)
+    elif dialect == 'sqlite' and words:
+        matches = _sqlite_search(matches, term, words, prefix)
+    else:
+        matches = matches.filter(_contains(term)).order_by(Question.id)
+
+    rows = matches.add_columns(func.count().over().label('total')) \
+        .limit(page_size).offset((page - 1) * page_size).all()
+    if rows:
+        total = rows[0].total
+    elif page > 1:
+        # past the last hit the window has no row to report the count on
+        total = matches.order_by(None).count()
+    else:
+        total = 0
+    return [row.Question.format() for row in rows], total
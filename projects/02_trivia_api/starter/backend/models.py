@@ -1,5 +1,6 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, create_engine, text
+from sqlalchemy.exc import DBAPIError, OperationalError
 from flask_sqlalchemy import SQLAlchemy
 import json
 
@@ -25,6 +26,7 @@ def setup_db(app, database_path=database_path):
     db.app = app
     db.init_app(app)
     db.create_all()
+    create_search_index(db.engine)
 
 
 """
@@ -69,6 +71,78 @@ class Question(db.Model):
         }
 
 
+'''
+Question search index
+    created by setup_db if missing, so existing databases get it too;
+    on postgres a GIN index over the english text search document of the
+    question and answer and, if pg_trgm can be installed, a trigram index over
+    their text for substring matches; on SQLite an FTS5 table kept in step
+    with questions by triggers
+'''
+
+QUESTION_SEARCH_TEXT = "coalesce(question, '') || ' ' || coalesce(answer, '')"
+QUESTION_SEARCH_DOCUMENT = f"to_tsvector('english', {QUESTION_SEARCH_TEXT})"
+
+POSTGRES_SEARCH_INDEX = \
+    f"CREATE INDEX IF NOT EXISTS ix_questions_search ON questions USING gin (({QUESTION_SEARCH_DOCUMENT}))"
+POSTGRES_TRIGRAM_INDEX = \
+    f"CREATE INDEX IF NOT EXISTS ix_questions_search_trgm ON questions USING gin (({QUESTION_SEARCH_TEXT}) gin_trgm_ops)"
+
+
+def sqlite_fts_index(name, tokenize):
+    # an external content FTS5 table over the question and answer text, kept
+    # in sync with questions by triggers
+    return [
+        f"CREATE VIRTUAL TABLE {name} USING fts5("
+        f"question, answer, content='questions', content_rowid='id', tokenize='{tokenize}')",
+        f"CREATE TRIGGER {name}_ai AFTER INSERT ON questions BEGIN "
+        f"INSERT INTO {name}(rowid, question, answer) VALUES (new.id, new.question, new.answer); END",
+        f"CREATE TRIGGER {name}_ad AFTER DELETE ON questions BEGIN "
+        f"INSERT INTO {name}({name}, rowid, question, answer) "
+        f"VALUES ('delete', old.id, old.question, old.answer); END",
+        f"CREATE TRIGGER {name}_au AFTER UPDATE ON questions BEGIN "
+        f"INSERT INTO {name}({name}, rowid, question, answer) "
+        f"VALUES ('delete', old.id, old.question, old.answer); "
+        f"INSERT INTO {name}(rowid, question, answer) VALUES (new.id, new.question, new.answer); END",
+        f"INSERT INTO {name}({name}) VALUES ('rebuild')",
+    ]
+
+
+SQLITE_SEARCH_INDEX = sqlite_fts_index('questions_fts', 'porter unicode61')
+SQLITE_TRIGRAM_INDEX = sqlite_fts_index('questions_trgm', 'trigram')
+
+
+def _sqlite_table_exists(connection, name):
+    return connection.execute(text("SELECT 1 FROM sqlite_master WHERE name = :name"), name=name).first()
+
+
+def create_search_index(engine):
+    if engine.dialect.name == 'postgresql':
+        try:
+            with engine.begin() as connection:
+                connection.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        except DBAPIError:
+            # no privilege to install it: substring matches go unindexed
+            pass
+        with engine.begin() as connection:
+            connection.execute(text(POSTGRES_SEARCH_INDEX))
+            if connection.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first():
+                connection.execute(text(POSTGRES_TRIGRAM_INDEX))
+    elif engine.dialect.name == 'sqlite':
+        with engine.begin() as connection:
+            if not _sqlite_table_exists(connection, 'questions_fts'):
+                for statement in SQLITE_SEARCH_INDEX:
+                    connection.execute(text(statement))
+        try:
+            with engine.begin() as connection:
+                if not _sqlite_table_exists(connection, 'questions_trgm'):
+                    for statement in SQLITE_TRIGRAM_INDEX:
+                        connection.execute(text(statement))
+        except OperationalError:
+            # no trigram tokenizer before SQLite 3.34: substring matches go unindexed
+            pass
+
+
 '''
 Category
 
@@ -89,3 +163,41 @@ class Category(db.Model):
             'id': self.id,
             'type': self.type
         }
+
+
+'''
+QuizSession
+    a quiz in progress, for the database quiz session store;
+    its shuffled deck is in quiz_session_questions, dealt from `position`
+'''
+
+
+class QuizSession(db.Model):
+    __tablename__ = 'quiz_sessions'
+
+    id = Column(String(32), primary_key=True)
+    position = Column(Integer, nullable=False, default=0)
+    size = Column(Integer, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class QuizSessionQuestion(db.Model):
+    __tablename__ = 'quiz_session_questions'
+
+    session_id = Column(String(32), ForeignKey('quiz_sessions.id', ondelete='CASCADE'), primary_key=True)
+    position = Column(Integer, primary_key=True)
+    question_id = Column(Integer, nullable=False)
+
+
+'''
+CacheVersion
+    the version stamp of a cached table, changed by every write to it,
+    so each process can tell when its copy is stale
+'''
+
+
+class CacheVersion(db.Model):
+    __tablename__ = 'cache_versions'
+
+    name = Column(String(64), primary_key=True)
+    version = Column(String(32), nullable=False)
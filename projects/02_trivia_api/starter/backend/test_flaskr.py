@@ -46,6 +46,12 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(data['success'], True)
 
+    def test_get_categories_not_modified(self):
+        etag = self.client().get('/categories').headers['ETag']
+        response = self.client().get('/categories', headers={'If-None-Match': etag})
+
+        self.assertEqual(response.status_code, 304)
+
     def test_get_paginated_questions(self):
         response = self.client().get('/questions', query_string=dict(page=1))
         data = json.loads(response.data)
@@ -72,6 +78,24 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 404)
         self.assertEqual(data['success'], False)
 
+    def test_get_paginated_questions_bad_page(self):
+        response = self.client().get('/questions', query_string=dict(page=0))
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+    def test_get_questions_after_cursor(self):
+        first_page = json.loads(self.client().get('/questions').data)
+        response = self.client().get('/questions', query_string=dict(cursor=first_page['next_cursor']))
+        data = json.loads(response.data)
+        second_page = json.loads(self.client().get('/questions', query_string=dict(page=2)).data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['questions'], second_page['questions'])
+        self.assertEqual(data['total_questions'], Question.query.count())
+
     def test_delete_question(self):
         question_id = 2
         response = self.client().delete(f'/questions/{question_id}')
@@ -149,6 +173,42 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['questions'] is not None)
         self.assertTrue(data['total_questions'] > 0)
 
+    def test_question_search_substring(self):
+        response = self.client().post(
+            '/questions_search',
+            data=json.dumps({'searchTerm': 'hal'}),
+            content_type='application/json'
+        )
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(any('Mahal' in q['question'] for q in data['questions']))
+
+    def test_question_search_past_last_page(self):
+        response = self.client().post(
+            '/questions_search',
+            data=json.dumps({'searchTerm': 'taj mahal', 'page': 1000}),
+            content_type='application/json'
+        )
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['questions'], [])
+        self.assertTrue(data['total_questions'] > 0)
+
+    def test_question_search_prefix(self):
+        response = self.client().post(
+            '/questions_search',
+            data=json.dumps({'searchTerm': 'taj mah', 'prefix': True}),
+            content_type='application/json'
+        )
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['total_questions'] > 0)
+        self.assertTrue(len(data['questions']) <= 10)
+
     def test_question_search_missing_term(self):
         response = self.client().post('/questions_search')
         data = json.loads(response.data)
@@ -194,6 +254,56 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(data['question'] is not None)
 
+    def test_quiz_category_exhausted(self):
+        category_id = 4
+        full_category = Category.query.get(category_id).format()
+        question_ids = [question.id for question in Question.query.filter(Question.category == category_id + 1)]
+
+        response = self.client().post(
+            '/quizzes',
+            data=json.dumps({
+                'previous_questions': question_ids,
+                'quiz_category': full_category
+            }),
+            content_type='application/json'
+        )
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['question'], None)
+
+    def test_quiz_session(self):
+        category_id = 4
+        full_category = Category.query.get(category_id).format()
+
+        response = self.client().post(
+            '/quizzes/sessions',
+            data=json.dumps({'quiz_category': full_category}),
+            content_type='application/json'
+        )
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['total_questions'] > 0)
+
+        dealt = []
+        for _ in range(data['total_questions']):
+            question = json.loads(self.client().post(f"/quizzes/{data['session_id']}/next").data)['question']
+            dealt.append(question['id'])
+        last = json.loads(self.client().post(f"/quizzes/{data['session_id']}/next").data)
+
+        self.assertEqual(len(set(dealt)), data['total_questions'])
+        self.assertEqual(last['question'], None)
+
+    def test_quiz_session_not_found(self):
+        response = self.client().post('/quizzes/not-a-session/next')
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(data['success'], False)
+
     def test_quiz_no_parameters(self):
         response = self.client().post('/quizzes')
         data = json.loads(response.data)
@@ -14,6 +14,10 @@ class QuestionView extends Component {
       totalQuestions: 0,
       categories: {},
       currentCategory: null,
+      // which questions the pages are read from: 'all', 'category' or 'search'
+      listing: 'all',
+      listingCategory: null,
+      searchTerm: '',
     }
   }
 
@@ -40,8 +44,22 @@ class QuestionView extends Component {
     })
   }
 
+  selectListing(listing, params = {}) {
+    this.setState({page: 1, listing, ...params}, () => this.loadPage());
+  }
+
   selectPage(num) {
-    this.setState({page: num}, () => this.getQuestions());
+    this.setState({page: num}, () => this.loadPage());
+  }
+
+  loadPage() {
+    if (this.state.listing === 'category') {
+      this.getByCategory(this.state.listingCategory);
+    } else if (this.state.listing === 'search') {
+      this.getBySearch(this.state.searchTerm);
+    } else {
+      this.getQuestions();
+    }
   }
 
   createPagination(){
@@ -60,7 +78,7 @@ class QuestionView extends Component {
 
   getByCategory= (id) => {
     $.ajax({
-      url: `/categories/${id}/questions`,
+      url: `/categories/${id}/questions?page=${this.state.page}`,
       type: "GET",
       success: (result) => {
         this.setState({
@@ -77,12 +95,16 @@ class QuestionView extends Component {
   }
 
   submitSearch = (searchTerm) => {
+    this.selectListing('search', {searchTerm});
+  }
+
+  getBySearch = (searchTerm) => {
     $.ajax({
       url: `/questions_search`,
       type: "POST",
       dataType: 'json',
       contentType: 'application/json',
-      data: JSON.stringify({searchTerm: searchTerm}),
+      data: JSON.stringify({searchTerm: searchTerm, page: this.state.page}),
       xhrFields: {
         withCredentials: true
       },
@@ -108,7 +130,7 @@ class QuestionView extends Component {
           url: `/questions/${id}`,
           type: "DELETE",
           success: (result) => {
-            this.getQuestions();
+            this.loadPage();
           },
           error: (error) => {
             alert('Unable to load questions. Please try your request again')
@@ -123,10 +145,10 @@ class QuestionView extends Component {
     return (
       <div className="question-view">
         <div className="categories-list">
-          <h2 onClick={() => {this.getQuestions()}}>Categories</h2>
+          <h2 onClick={() => {this.selectListing('all')}}>Categories</h2>
           <ul>
             {Object.keys(this.state.categories).map((id, ) => (
-              <li key={id} onClick={() => {this.getByCategory(id)}}>
+              <li key={id} onClick={() => {this.selectListing('category', {listingCategory: id})}}>
                 {this.state.categories[id]}
                 <img className="category" src={`${this.state.categories[id]}.svg`}/>
               </li>